@@ -0,0 +1,82 @@
+"""
+Asset cache
+
+Loads each image from disk once, converts it to the display's pixel format once, and scales it once for each scale it
+is asked for. Every caller gets the same shared surface back, so the game loop never reads or decodes a PNG.
+
+The cached surfaces are shared, so they must not be drawn on (copy them first, as 'Box.colorize' does).
+
+Since converted and scaled surfaces depend on the display, the cache is cleared when the resolution changes.
+
+Xlantra1
+Copyright (c) 2017
+MIT License
+"""
+
+# region Imports
+import pygame
+
+# endregion
+
+
+# region Asset Cache Class
+class AssetCache(object):
+    # region Initialization
+    def __init__(self):
+        # The surfaces, by (path, scale, pixel format)
+        self.images = {}
+
+        # The resolution the surfaces were converted (and scaled) for
+        self.resolution = None
+
+        self.load_count = 0
+
+    # endregion
+
+    # region Images
+    def set_resolution(self, resolution):
+        """
+        Clears the cache if the resolution has changed, so every image is converted and scaled again
+
+        :param resolution: The size of the screen (width, height)
+        :return:           True if the cache was cleared, otherwise False
+        """
+        resolution = tuple(resolution)
+        if resolution == self.resolution:
+            return False
+
+        self.resolution = resolution
+        self.images.clear()
+
+        return True
+
+    def get_image(self, path, scale=1.0, alpha=True):
+        """
+        An image, loaded, converted and scaled the first time it is asked for, and shared from then on
+
+        :param path:  The path of the image
+        :param scale: The scale of the image (e.g. 1.0 is no resize, 0.5 is half scale)
+        :param alpha: Whether the image keeps its alpha channel ('convert_alpha'), or is converted to the display's
+                      format without it ('convert')
+        :return:      The image (shared, so don't draw on it)
+        """
+        pixel_format = 'alpha' if alpha is True else 'opaque'
+        key = (path, scale, pixel_format)
+
+        image = self.images.get(key)
+        if image is None:
+            if scale == 1.0:
+                image = pygame.image.load(path)
+                image = image.convert_alpha() if alpha is True else image.convert()
+                self.load_count += 1
+            else:
+                """ Scaled images are made from the unscaled image, so the file is still only read once """
+                image = self.get_image(path, 1.0, alpha)
+                image_size = image.get_size()
+                image = pygame.transform.scale(image, (int(image_size[0] * scale), int(image_size[1] * scale)))
+
+            self.images[key] = image
+
+        return image
+    # endregion
+# endregion
@@ -0,0 +1,279 @@
+"""
+Ball tracker
+
+Owns the state of the ball (position, velocity, radius and confidence) and follows it with a constant acceleration
+Kalman filter. This lets the game predict where the ball is between detections, and where it will be by the time a
+frame is displayed.
+
+Several balls can also be tracked at once, with detections matched to the nearest tracked ball of the same profile
+
+Reference => https://en.wikipedia.org/wiki/Kalman_filter
+
+Xlantra1
+Copyright (c) 2017
+MIT License
+"""
+
+# region Imports
+import math
+
+import numpy as np
+
+# endregion
+
+
+# region Ball Tracker Class
+class BallTracker(object):
+    # region Initialization
+    def __init__(self, profile=0):
+        # The color profile of the ball being tracked
+        self.profile = profile
+
+        # How much the acceleration is expected to change (pixels per second cubed)
+        self.process_noise = 5000.0
+        # How far off a detection is expected to be (pixels)
+        self.measurement_noise = 2.0
+
+        self.radius_smoothing = 0.5
+
+        # The ball is forgotten once it hasn't been detected for this long (seconds)
+        self.max_prediction_time = 0.5
+        # How many detections it takes for the tracker to be fully confident
+        self.confident_detections = 3
+
+        # State is (x, velocity x, acceleration x, y, velocity y, acceleration y)
+        self.state = None
+        self.covariance = None
+
+        self.radius = 0
+        self.timestamp = None
+        self.last_detection_timestamp = None
+        self.detections = 0
+
+        self.measurement_matrix = np.zeros((2, 6))
+        self.measurement_matrix[0, 0] = 1.0
+        self.measurement_matrix[1, 3] = 1.0
+
+    # endregion
+
+    # region State
+    def reset(self):
+        """ Forgets the ball """
+        self.state = None
+        self.covariance = None
+
+        self.radius = 0
+        self.timestamp = None
+        self.last_detection_timestamp = None
+        self.detections = 0
+
+    def is_tracking(self):
+        return self.state is not None
+
+    @property
+    def position(self):
+        return self.state[0], self.state[3]
+
+    @property
+    def velocity(self):
+        return self.state[1], self.state[4]
+
+    @property
+    def acceleration(self):
+        return self.state[2], self.state[5]
+
+    @property
+    def confidence(self):
+        """
+        How sure the tracker is of the ball's position, from 0.0 to 1.0.
+        Builds up with each detection and falls off the longer the ball goes without being detected.
+        """
+        if self.state is None:
+            return 0.0
+
+        detection_confidence = min(1.0, float(self.detections) / self.confident_detections)
+        time_since_detection = self.timestamp - self.last_detection_timestamp
+
+        return detection_confidence * max(0.0, 1.0 - time_since_detection / self.max_prediction_time)
+
+    # endregion
+
+    # region Kalman Filter
+    @staticmethod
+    def transition_matrix(dt):
+        """
+        The constant acceleration motion model, for both axes
+
+        :param dt: The time step (in seconds)
+        :return:   The 6x6 state transition matrix
+        """
+        axis = np.array([[1.0, dt, 0.5 * dt * dt],
+                         [0.0, 1.0, dt],
+                         [0.0, 0.0, 1.0]])
+
+        transition = np.zeros((6, 6))
+        transition[0:3, 0:3] = axis
+        transition[3:6, 3:6] = axis
+
+        return transition
+
+    def process_noise_matrix(self, dt):
+        """
+        The noise added by the motion model over a time step, for a randomly changing acceleration
+
+        :param dt: The time step (in seconds)
+        :return:   The 6x6 process noise covariance matrix
+        """
+        axis = np.array([[dt ** 5 / 20.0, dt ** 4 / 8.0, dt ** 3 / 6.0],
+                         [dt ** 4 / 8.0, dt ** 3 / 3.0, dt ** 2 / 2.0],
+                         [dt ** 3 / 6.0, dt ** 2 / 2.0, dt]]) * (self.process_noise ** 2)
+
+        noise = np.zeros((6, 6))
+        noise[0:3, 0:3] = axis
+        noise[3:6, 3:6] = axis
+
+        return noise
+
+    def predict(self, timestamp):
+        """
+        Moves the tracker forward to the timestamp, without a detection.
+        The ball is forgotten if it hasn't been detected for 'max_prediction_time'.
+
+        :param timestamp: The time (in seconds) to move the tracker to
+        :return:          None
+        """
+        if self.state is None:
+            return
+
+        dt = timestamp - self.timestamp
+        if dt > 0:
+            transition = self.transition_matrix(dt)
+
+            self.state = transition.dot(self.state)
+            self.covariance = transition.dot(self.covariance).dot(transition.T) + self.process_noise_matrix(dt)
+            self.timestamp = timestamp
+
+        if timestamp - self.last_detection_timestamp > self.max_prediction_time:
+            self.reset()
+
+    def update(self, detection, timestamp):
+        """
+        Moves the tracker forward to the timestamp, then corrects it with a detection
+
+        :param detection: A named tuple for BallDetection
+        :param timestamp: The time (in seconds) the detection's frame was captured
+        :return:          None
+        """
+        measurement = np.array([detection.x, detection.y])
+
+        if self.state is not None:
+            self.predict(timestamp)
+
+        if self.state is None:
+            self.state = np.array([detection.x, 0.0, 0.0, detection.y, 0.0, 0.0])
+            self.covariance = np.diag([self.measurement_noise ** 2, 1000.0 ** 2, 5000.0 ** 2] * 2)
+
+            self.radius = detection.radius
+        else:
+            measurement_noise = np.eye(2) * (self.measurement_noise ** 2)
+
+            residual = measurement - self.measurement_matrix.dot(self.state)
+            residual_covariance = self.measurement_matrix.dot(self.covariance).dot(
+                self.measurement_matrix.T) + measurement_noise
+            gain = self.covariance.dot(self.measurement_matrix.T).dot(np.linalg.inv(residual_covariance))
+
+            self.state = self.state + gain.dot(residual)
+            self.covariance = (np.eye(6) - gain.dot(self.measurement_matrix)).dot(self.covariance)
+
+            self.radius += (detection.radius - self.radius) * self.radius_smoothing
+
+        self.timestamp = timestamp
+        self.last_detection_timestamp = timestamp
+        self.detections += 1
+
+    def predict_position(self, timestamp):
+        """
+        Predicts where the ball will be at the timestamp, without moving the tracker.
+        Used to make up for the time between a frame being captured and it being displayed.
+
+        :param timestamp: The time (in seconds) to predict the position for
+        :return:          The predicted (x, y) position
+        """
+        dt = min(max(0.0, timestamp - self.timestamp), self.max_prediction_time)
+
+        x, velocity_x, acceleration_x, y, velocity_y, acceleration_y = self.state
+
+        return (x + velocity_x * dt + 0.5 * acceleration_x * dt * dt,
+                y + velocity_y * dt + 0.5 * acceleration_y * dt * dt)
+    # endregion
+# endregion
+
+
+# region Multi Ball Tracker Class
+class MultiBallTracker(object):
+    # region Initialization
+    def __init__(self):
+        # A detection further than this (in pixels) from every tracked ball starts a new one
+        self.max_match_distance = 150.0
+
+        self.trackers = []
+
+    # endregion
+
+    # region Tracking
+    def predict(self, timestamp):
+        """
+        Moves every tracked ball forward to the timestamp, and forgets any that have been lost for too long
+
+        :param timestamp: The time (in seconds) to move the trackers to
+        :return:          None
+        """
+        for tracker in self.trackers:
+            tracker.predict(timestamp)
+
+        self.trackers = [tracker for tracker in self.trackers if tracker.is_tracking()]
+
+    def update(self, detections, timestamp):
+        """
+        Matches each detection to the closest tracked ball of the same profile, starting new trackers for the rest
+
+        :param detections: A list of ProfileDetection named tuples
+        :param timestamp:  The time (in seconds) the detections' frame was captured
+        :return:           None
+        """
+        self.predict(timestamp)
+
+        matches = []
+        for detection_index, (profile, detection) in enumerate(detections):
+            for tracker_index, tracker in enumerate(self.trackers):
+                if tracker.profile != profile:
+                    continue
+
+                tracker_x, tracker_y = tracker.position
+                distance = math.hypot(detection.x - tracker_x, detection.y - tracker_y)
+
+                if distance < self.max_match_distance:
+                    matches.append((distance, detection_index, tracker_index))
+
+        """ Closest pairs are matched first, so each detection and tracker is only used once """
+        matches.sort()
+
+        matched_detections = set()
+        matched_trackers = set()
+        for distance, detection_index, tracker_index in matches:
+            if detection_index in matched_detections or tracker_index in matched_trackers:
+                continue
+
+            self.trackers[tracker_index].update(detections[detection_index].detection, timestamp)
+
+            matched_detections.add(detection_index)
+            matched_trackers.add(tracker_index)
+
+        for detection_index, (profile, detection) in enumerate(detections):
+            if detection_index not in matched_detections:
+                tracker = BallTracker(profile)
+                tracker.update(detection, timestamp)
+
+                self.trackers.append(tracker)
+    # endregion
+# endregion
@@ -0,0 +1,728 @@
+"""
+Benchmarks for the ball detection
+
+Times different ways of doing the same detection work on identical frames, so you can see which is faster on the
+machine the game will run on. Also checks that detection doesn't allocate new buffers once it is running (the run fails
+if it does)
+
+Also times every stage of the game loop (capture through to the display flip) on synthetic scenes, with no camera or
+screen needed. The stage timings can be saved as a baseline, and later runs fail when a stage gets slower than it by
+more than the threshold:
+
+    python benchmark.py --save-baseline benchmark_baseline.json
+    python benchmark.py --stages-only --baseline benchmark_baseline.json
+
+Xlantra1
+Copyright (c) 2017
+MIT License
+"""
+
+# region Imports
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from collections import OrderedDict
+from collections import deque
+
+import cv2
+import numpy as np
+
+""" The stage benchmarks never open a window """
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+import pygame
+
+from ball_tracker import BallTracker
+from boxes import Box
+from collision import find_collisions
+from collision import get_ball_paths
+from collision import get_box_circles
+from color_lookup import ColorLookupTable
+from detection import BallDetector
+from frame_buffers import FrameBufferPool
+from parallel_mask import ParallelMaskStage
+from hud import Hud
+from hud import create_base_rings
+from sprite_batch import SpriteBatch
+from synthetic_scene import SyntheticScene
+from synthetic_scene import create_background
+from synthetic_scene import hsv_to_color
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# endregion
+
+# region Global Variables
+resolutions = [(1280, 720), (1920, 1080)]
+repeat = 50
+
+# Used when there is no 'settings.txt' (an orange ball)
+default_color_range_lower = (5, 120, 120)
+default_color_range_upper = (20, 255, 255)
+
+# The stage benchmarks run every trajectory at every resolution, for this many frames each
+stage_trajectories = ['line', 'throw', 'circle']
+stage_frames = 90
+stage_boxes = 10
+stage_seed = 0
+
+# The sprite batch benchmark draws this many boxes (a large wave)
+sprite_benchmark_boxes = 300
+
+# A stage fails against the baseline when its median is this much slower (0.25 is 25%)...
+regression_threshold = 0.25
+# ...and at least this many milliseconds slower (so tiny stages don't fail on timer noise)
+regression_min_milliseconds = 0.05
+# endregion
+
+# region Frames
+
+
+def create_test_frame(width, height, ball_color_hsv, seed=0):
+    """
+    Creates a frame with a noisy, textured background and a ball in the middle of it
+
+    :param width:          The width of the frame
+    :param height:         The height of the frame
+    :param ball_color_hsv: The color of the ball (in OpenCV's HSV)
+    :param seed:           The seed for the background noise, so the same frame is created every time
+    :return:               The RGB frame
+    """
+    random_state = np.random.RandomState(seed)
+    frame = create_background(width, height, random_state)
+
+    noise = random_state.randint(0, 16, frame.shape).astype(np.uint8)
+    frame = cv2.add(frame, noise)
+
+    cv2.circle(frame, (width / 2, height / 2), height / 20, hsv_to_color(ball_color_hsv), -1)
+
+    return frame
+
+
+def load_color_range():
+    """
+    Loads the color range from 'settings.txt' (the same as the game), or the default range if there isn't one.
+    Only the first color profile is used, so reading stops at the next 'profile => <name>' line.
+
+    :return: The lower and upper HSV bounds
+    """
+    try:
+        settings_file = open("settings.txt", "r")
+    except IOError:
+        return default_color_range_lower, default_color_range_upper
+
+    settings = {}
+    for setting_value in settings_file.readlines():
+        if setting_value.startswith("profile => "):
+            if len(settings) > 0:
+                break
+        elif " => " in setting_value:
+            name, value = setting_value.replace("\n", "").split(" => ")
+            settings[name] = int(value)
+
+    settings_file.close()
+
+    return ((settings["v1_min"], settings["v2_min"], settings["v3_min"]),
+            (settings["v1_max"], settings["v2_max"], settings["v3_max"]))
+
+
+# endregion
+
+# region Timing
+
+
+def time_function(function, frame):
+    """
+    Times how long a function takes to run on a frame
+
+    :param function: The function to time (it is given the frame)
+    :param frame:    The frame
+    :return:         The average time (in milliseconds)
+    """
+    function(frame)
+
+    start = time.time()
+    for _ in xrange(repeat):
+        function(frame)
+    end = time.time()
+
+    return (end - start) * 1000.0 / repeat
+
+
+def time_calls(owner, name, durations, duration_name):
+    """
+    Replaces a function (of a module or an object) with one that adds the time each call takes to a running total
+
+    :param owner:         The module or object the function belongs to
+    :param name:          The name of the function
+    :param durations:     The running totals (in milliseconds), by name
+    :param duration_name: The name of the total the calls are added to
+    :return:              The original function, to put back once done
+    """
+    function = getattr(owner, name)
+
+    def timed(*args, **kwargs):
+        call_start = time.time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            durations[duration_name] += (time.time() - call_start) * 1000.0
+
+    setattr(owner, name, timed)
+
+    return function
+
+
+def get_percentiles(durations):
+    """
+    Summarizes a list of durations
+
+    :param durations: The durations (in milliseconds)
+    :return:          A dictionary of the mean, 50th, 95th and 99th percentiles, and max (in milliseconds)
+    """
+    p50, p95, p99 = np.percentile(durations, [50, 95, 99])
+
+    return OrderedDict([('mean', float(np.mean(durations))), ('p50', float(p50)), ('p95', float(p95)),
+                        ('p99', float(p99)), ('max', float(np.max(durations)))])
+
+
+# endregion
+
+# region Game Stages
+
+
+def draw_trail(image, pts, thickness=2.5):
+    """
+    Draws the ball trail, the same as the game loop
+
+    :param image:     The frame to draw on
+    :param pts:       The trail's points (newest first, None where the ball was lost)
+    :param thickness: The thickness of the newest part of the trail
+    :return:          None
+    """
+    for i in xrange(1, len(pts)):
+        if pts[i - 1] is None or pts[i] is None:
+            continue
+
+        cv2.line(image, pts[i - 1], pts[i], (150, 255, 255), int(np.sqrt(64 / float(i + 1)) * thickness))
+
+
+def blit_scene(screen, camera_surface, camera_frame, box_class, sprite_batch, hud):
+    """
+    Draws everything the game loop draws, the same way: the camera frame, the boxes and the home base (in one sprite
+    batch), then the HUD (the rings over the base, and the lives)
+
+    :param screen:         The display surface
+    :param camera_surface: The screen oriented surface the camera frame is copied into
+    :param camera_frame:   The RGB camera frame
+    :param box_class:      The 'Box' manager
+    :param sprite_batch:   The SpriteBatch the boxes and home base are drawn with
+    :param hud:            The Hud
+    :return:               None
+    """
+    screen_width, screen_height = screen.get_size()
+
+    pygame.surfarray.blit_array(camera_surface, camera_frame.swapaxes(0, 1))
+    screen.blit(camera_surface, (0, 0))
+
+    box_slots = box_class.store.get_alive()
+    for slot, (box_x, box_y) in zip(box_slots, box_class.store.positions[box_slots]):
+        sprite_batch.add(box_class.get_box_image(slot), (int(box_x), int(box_y)))
+
+    for home in box_class.home:
+        home_size = home.img.get_size()
+        sprite_batch.add(home.img, ((screen_width / 2) - (home_size[0] / 2), screen_height - (home_size[1] / 3)))
+
+    sprite_batch.draw(screen)
+
+    hud.set_value('lives', 10)
+    hud.draw(screen)
+
+
+# endregion
+
+# region Benchmarks
+
+
+def benchmark_color_lookup(color_range_lower, color_range_upper):
+    """
+    Compares creating the mask with 'cvtColor' and 'inRange' against the precomputed color lookup table
+
+    :param color_range_lower: The lower HSV bound
+    :param color_range_upper: The upper HSV bound
+    :return:                  None
+    """
+    print "Color mask (cvtColor + inRange vs lookup table)"
+
+    start = time.time()
+    color_lookup = ColorLookupTable(color_range_lower, color_range_upper)
+    print "  Lookup table built in {0:.1f} ms".format((time.time() - start) * 1000.0)
+
+    def hsv_mask(image):
+        hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
+        return cv2.inRange(hsv, color_range_lower, color_range_upper)
+
+    ball_color_hsv = [(l + u) / 2 for l, u in zip(color_range_lower, color_range_upper)]
+
+    for width, height in resolutions:
+        frame = create_test_frame(width, height, ball_color_hsv)
+
+        matching = np.count_nonzero(hsv_mask(frame) == color_lookup.create_mask(frame))
+        hsv_time = time_function(hsv_mask, frame)
+        lookup_time = time_function(color_lookup.create_mask, frame)
+
+        print "  {0}x{1}: cvtColor + inRange {2:.2f} ms, lookup table {3:.2f} ms ({4:.1f}x), " \
+              "{5:.2f}% matching pixels".format(width, height, hsv_time, lookup_time, hsv_time / lookup_time,
+                                                 100.0 * matching / (width * height))
+
+
+def benchmark_parallel_mask(color_range_lower, color_range_upper):
+    """
+    Compares creating the mask (conversion, threshold and noise removal) on one thread against in stripes on a
+    thread pool, for a few different numbers of workers
+
+    :param color_range_lower: The lower HSV bound
+    :param color_range_upper: The upper HSV bound
+    :return:                  None
+    """
+    print "Color mask (serial vs stripes on a thread pool)"
+
+    ball_color_hsv = [(l + u) / 2 for l, u in zip(color_range_lower, color_range_upper)]
+    worker_counts = sorted(set([2, 4, multiprocessing.cpu_count()]))
+
+    for width, height in resolutions:
+        frame = create_test_frame(width, height, ball_color_hsv)
+
+        ball_detector = BallDetector(color_range_lower, color_range_upper)
+        ball_detector.buffer_pool = FrameBufferPool(width, height)
+
+        serial_mask = ball_detector.create_color_mask(frame).copy()
+        serial_time = time_function(ball_detector.create_color_mask, frame)
+
+        results = []
+        for workers in worker_counts:
+            parallel_mask = ParallelMaskStage(workers)
+            ball_detector.parallel_mask = parallel_mask
+
+            matching = np.array_equal(serial_mask, ball_detector.create_color_mask(frame))
+            parallel_time = time_function(ball_detector.create_color_mask, frame)
+
+            results.append("{0} workers {1:.2f} ms ({2:.1f}x{3})".format(
+                workers, parallel_time, serial_time / parallel_time, "" if matching else ", MISMATCH"))
+
+            ball_detector.parallel_mask = None
+            parallel_mask.close()
+
+        print "  {0}x{1}: serial {2:.2f} ms, {3}".format(width, height, serial_time, ", ".join(results))
+
+
+def benchmark_sprite_batch(boxes=sprite_benchmark_boxes):
+    """
+    Compares drawing a large wave of boxes with one 'blit' call each against one 'blits' call (the sprite batch)
+
+    :param boxes: How many boxes to draw
+    :return:      None
+    """
+    print "Box drawing ({0} boxes, blit per box vs sprite batch)".format(boxes)
+
+    pygame.display.init()
+    random.seed(stage_seed)
+
+    for width, height in resolutions:
+        screen = pygame.display.set_mode((width, height))
+
+        box_class = Box(screen)
+        box_class.maxBoxes = boxes
+        box_class.resolution_multiply = (width / 1920.0, height / 1080.0)
+        for _ in xrange(boxes):
+            box_class.box_manager()
+
+        box_slots = box_class.store.get_alive()
+        box_locations = [(int(box_x), int(box_y)) for box_x, box_y in box_class.store.positions[box_slots]]
+        box_images = [box_class.get_box_image(slot) for slot in box_slots]
+        sprites = zip(box_images, box_locations)
+
+        def blit_each(_):
+            for box_image, box_location in sprites:
+                screen.blit(box_image, box_location)
+
+        def blit_batch(sprite_batch):
+            for box_image, box_location in sprites:
+                sprite_batch.add(box_image, box_location)
+            sprite_batch.draw(screen)
+
+        blit_time = time_function(blit_each, None)
+        batch_time = time_function(blit_batch, SpriteBatch())
+
+        print "  {0}x{1}: blit per box {2:.2f} ms, sprite batch {3:.2f} ms".format(width, height, blit_time, batch_time)
+
+
+def watch_destinations(function_names, misses):
+    """
+    Wraps OpenCV functions, so every call with a 'dst' whose result doesn't share memory with it (OpenCV allocates
+    a new array when 'dst' has the wrong size or type, and only returns it) is counted
+
+    :param function_names: The names of the OpenCV functions to wrap
+    :param misses:         The count of calls that didn't write into their 'dst', by function name (added to)
+    :return:               The original functions by name, to put back once done
+    """
+    original_functions = dict((name, getattr(cv2, name)) for name in function_names)
+
+    def watch(name, function):
+        def watched(*args, **kwargs):
+            result = function(*args, **kwargs)
+
+            dst = kwargs.get('dst')
+            if dst is not None:
+                """ 'threshold' returns the threshold value and the image """
+                image = result[1] if isinstance(result, tuple) else result
+                if not np.may_share_memory(image, dst):
+                    misses[name] = misses.get(name, 0) + 1
+
+            return result
+
+        return watched
+
+    for name, function in original_functions.items():
+        setattr(cv2, name, watch(name, function))
+
+    return original_functions
+
+
+def benchmark_allocations(color_range_lower, color_range_upper, frames=100):
+    """
+    Checks that ball detection stops allocating buffers once it is running. After the first frame:
+        - Neither the buffer pool nor the color lookup table's packed pixels may be allocated again
+        - Every stage's output (the HSV image, the in-range mask, the eroded and final masks, and the scaled frame)
+          must share memory with its pool buffer, on every frame
+        - The pool's buffers must not move
+
+    The HSV and lookup table masks are checked at full scale, and the HSV mask at half scale (for the scaled frame),
+    with the search window turned off so the full frame is processed every time.
+
+    The peak memory allocated above the start is also shown, where 'tracemalloc' is available (Python 3).
+
+    :param color_range_lower: The lower HSV bound
+    :param color_range_upper: The upper HSV bound
+    :param frames:            How many frames to check over
+    :return:                  A list of the checks that failed (empty if none did)
+    """
+    print "Detection allocations (steady state)"
+
+    ball_color_hsv = [(l + u) / 2 for l, u in zip(color_range_lower, color_range_upper)]
+    failures = []
+
+    for width, height in resolutions:
+        frame = create_test_frame(width, height, ball_color_hsv)
+
+        for mask_name, color_lookup, scale in [("HSV", None, 1.0),
+                                               ("lookup table", ColorLookupTable(color_range_lower,
+                                                                                 color_range_upper), 1.0),
+                                               ("HSV half scale", None, 0.5)]:
+            ball_detector = BallDetector(color_range_lower, color_range_upper)
+            ball_detector.search_window = False
+            ball_detector.color_lookup = color_lookup
+            ball_detector.scale = scale
+            buffer_pool = ball_detector.buffer_pool = FrameBufferPool(width, height)
+
+            """ The first frame allocates the buffers """
+            ball_detector.detect(frame)
+            allocations = buffer_pool.allocations
+            packed_pixels = color_lookup.packed_pixels if color_lookup is not None else None
+            buffer_addresses = dict((key, buffer.ctypes.data) for key, buffer in buffer_pool.buffers.items())
+
+            if tracemalloc is not None:
+                tracemalloc.start()
+                start_size = tracemalloc.get_traced_memory()[0]
+
+            misses = {}
+            original_functions = watch_destinations(['cvtColor', 'inRange', 'erode', 'dilate', 'resize'], misses)
+            try:
+                for _ in xrange(frames):
+                    ball_detector.detect(frame)
+
+                    """ The lookup table's mask is written by NumPy, so it is checked directly """
+                    if color_lookup is not None:
+                        in_range = buffer_pool.get('in_range')
+                        if not np.may_share_memory(color_lookup.create_mask(frame, in_range), in_range):
+                            misses['lookup mask'] = misses.get('lookup mask', 0) + 1
+            finally:
+                for name, function in original_functions.items():
+                    setattr(cv2, name, function)
+
+            if tracemalloc is not None:
+                peak_size = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+            new_buffers = buffer_pool.allocations - allocations
+            if color_lookup is not None and color_lookup.packed_pixels is not packed_pixels:
+                new_buffers += 1
+
+            moved_buffers = sum(1 for key, buffer in buffer_pool.buffers.items()
+                                if buffer_addresses.get(key) != buffer.ctypes.data)
+
+            result = "{0} new buffers, {1} moved buffers, {2} outputs outside their buffers".format(
+                new_buffers, moved_buffers, sum(misses.values()))
+            if len(misses) > 0:
+                result += " ({0})".format(", ".join("{0} {1}".format(name, count)
+                                                    for name, count in sorted(misses.items())))
+
+            if tracemalloc is not None:
+                result += ", {0} bytes peak above the start".format(peak_size - start_size)
+
+            if new_buffers > 0 or moved_buffers > 0 or len(misses) > 0:
+                failures.append("{0}x{1} {2}".format(width, height, mask_name))
+                result += ", FAILED"
+
+            print "  {0}x{1} {2}: {3}".format(width, height, mask_name, result)
+
+    return failures
+
+
+def finish_stage(timings, name, stage_start):
+    """
+    Records how long a stage took
+
+    :param timings:     The durations of every stage, keyed by name
+    :param name:        The name of the stage that just finished
+    :param stage_start: When the stage started
+    :return:            When the stage finished (so the next stage starts from it)
+    """
+    stage_end = time.time()
+    timings[name].append((stage_end - stage_start) * 1000.0)
+
+    return stage_end
+
+
+def benchmark_stages(color_range_lower, color_range_upper, frames=stage_frames):
+    """
+    Times every stage of the game loop, one frame at a time, on synthetic scenes (a ball following each of
+    'stage_trajectories'). The display is SDL's dummy driver, so nothing is shown.
+
+    Each stage runs the game's own code, with the game's default settings: the ball detector's 'detect' (with its
+    search window), the ball tracker, and the same ball paths and collision test. 'masking', 'morphology' and
+    'contours' are the parts of 'detection' spent creating the in-range mask, eroding and dilating it, and finding the
+    ball in it.
+
+    :param color_range_lower: The lower HSV bound
+    :param color_range_upper: The upper HSV bound
+    :param frames:            How many frames to time for each trajectory
+    :return:                  The summary of every stage (and the whole frame), keyed by resolution then stage
+    """
+    print "Game loop stages ({0} synthetic frames per trajectory)".format(frames)
+
+    ball_color_hsv = [(l + u) / 2 for l, u in zip(color_range_lower, color_range_upper)]
+    stage_names = ['capture', 'color conversion', 'detection', 'masking', 'morphology', 'contours', 'box management',
+                   'collision', 'trail', 'blitting', 'flip']
+
+    pygame.display.init()
+    pygame.font.init()
+    results = OrderedDict()
+
+    for width, height in resolutions:
+        random.seed(stage_seed)
+
+        screen = pygame.display.set_mode((width, height))
+        camera_surface = pygame.Surface((width, height)).convert()
+        camera_image = None
+
+        buffer_pool = FrameBufferPool(width, height)
+        ball_detector = BallDetector(color_range_lower, color_range_upper)
+        ball_detector.buffer_pool = buffer_pool
+        ball_tracker = BallTracker()
+
+        """ The time spent in each part of detection, for the current frame """
+        detection_parts = OrderedDict((name, 0.0) for name in ['masking', 'morphology', 'contours'])
+        time_calls(ball_detector, 'create_color_mask', detection_parts, 'masking')
+        time_calls(ball_detector, 'find_largest_circle', detection_parts, 'contours')
+
+        resolution_multiply = (width / 1920.0, height / 1080.0)
+        box_class = Box(screen)
+        box_class.maxBoxes = stage_boxes
+        box_class.resolution_multiply = resolution_multiply
+
+        """ The sprite batch and HUD are set up the same as the game's """
+        sprite_batch = SpriteBatch()
+
+        hud = Hud(pygame.font.SysFont("Times New Roman", 24))
+        hud.add_overlay('base rings', lambda resolution: create_base_rings(resolution, resolution_multiply[1]))
+        hud.add_text('lives', "Lives: {0}", (25, height - 35))
+
+        pts = deque(maxlen=64)
+        home_center = (width / 2, height + 25)
+
+        timings = OrderedDict((name, []) for name in stage_names)
+        frame_durations = []
+
+        original_functions = [time_calls(cv2, name, detection_parts, 'morphology') for name in ['erode', 'dilate']]
+
+        for trajectory in stage_trajectories:
+            scene = SyntheticScene(width, height, ball_color_hsv, trajectory, frames, stage_seed)
+
+            """ Each trajectory is a new throw """
+            ball_detector.reset()
+            ball_tracker.reset()
+            previous_ball_positions = {}
+
+            for _ in xrange(frames):
+                frame_start = time.time()
+
+                _, camera_image = scene.read(camera_image)
+                timestamp = scene.last_timestamp
+                stage_start = finish_stage(timings, 'capture', frame_start)
+
+                camera_frame = cv2.cvtColor(camera_image, cv2.COLOR_BGR2RGB, dst=buffer_pool.get('rgb', channels=3))
+                stage_start = finish_stage(timings, 'color conversion', stage_start)
+
+                for name in detection_parts:
+                    detection_parts[name] = 0.0
+
+                center = None
+                detection = ball_detector.detect(camera_frame)
+                if detection is not None and detection.radius > 10:
+                    center = detection.center
+                    ball_tracker.update(detection, timestamp)
+                else:
+                    ball_tracker.predict(timestamp)
+
+                tracked_balls = [ball_tracker] if ball_tracker.is_tracking() else []
+                if center is None and len(tracked_balls) > 0:
+                    center = tuple(int(value) for value in ball_tracker.position)
+                stage_start = finish_stage(timings, 'detection', stage_start)
+
+                timings['masking'].append(detection_parts['masking'] - detection_parts['morphology'])
+                timings['morphology'].append(detection_parts['morphology'])
+                timings['contours'].append(detection_parts['contours'])
+
+                box_class.box_manager()
+                stage_start = finish_stage(timings, 'box management', stage_start)
+
+                balls, previous_ball_positions = get_ball_paths(tracked_balls, previous_ball_positions, timestamp)
+                box_slots, box_centers, box_radii = get_box_circles(box_class.store)
+                hit_boxes, home_boxes = find_collisions(box_centers, box_radii, balls, home_center, 100)
+                box_class.store.remove(box_slots[hit_boxes])
+                box_class.store.remove(box_slots[home_boxes])
+                stage_start = finish_stage(timings, 'collision', stage_start)
+
+                pts.appendleft(center)
+                draw_trail(camera_frame, pts)
+                stage_start = finish_stage(timings, 'trail', stage_start)
+
+                blit_scene(screen, camera_surface, camera_frame, box_class, sprite_batch, hud)
+                stage_start = finish_stage(timings, 'blitting', stage_start)
+
+                pygame.display.flip()
+                frame_end = finish_stage(timings, 'flip', stage_start)
+
+                frame_durations.append((frame_end - frame_start) * 1000.0)
+
+        for name, function in zip(['erode', 'dilate'], original_functions):
+            setattr(cv2, name, function)
+
+        summaries = OrderedDict((name, get_percentiles(durations)) for name, durations in timings.items())
+        summaries['end to end'] = get_percentiles(frame_durations)
+
+        resolution = "{0}x{1}".format(width, height)
+        results[resolution] = summaries
+
+        print "  {0}: {1:.1f} frames per second".format(resolution, 1000.0 / summaries['end to end']['mean'])
+        for name, summary in summaries.items():
+            print "    {0:<17} mean {1:7.3f} ms, p50 {2:7.3f} ms, p95 {3:7.3f} ms, p99 {4:7.3f} ms, " \
+                  "max {5:7.3f} ms".format(name, *summary.values())
+
+    pygame.display.quit()
+
+    return results
+
+
+def compare_with_baseline(results, baseline, threshold=regression_threshold):
+    """
+    Compares the median time of every stage against a baseline from 'benchmark_stages'
+
+    :param results:   The results from 'benchmark_stages'
+    :param baseline:  The baseline results (in the same format)
+    :param threshold: How much slower a stage can get before it fails (0.25 is 25%)
+    :return:          A list of the stages that got too slow
+    """
+    print "Compared with the baseline (fails over {0:.0f}% slower)".format(threshold * 100.0)
+
+    regressions = []
+
+    for resolution, summaries in results.items():
+        if resolution not in baseline:
+            print "  {0}: not in the baseline, skipped".format(resolution)
+            continue
+
+        for name, summary in summaries.items():
+            baseline_summary = baseline[resolution].get(name)
+            if baseline_summary is None:
+                continue
+
+            median = summary['p50']
+            baseline_median = baseline_summary['p50']
+
+            if median - baseline_median > regression_min_milliseconds and \
+                    median > baseline_median * (1.0 + threshold):
+                regressions.append("{0} {1}".format(resolution, name))
+                print "  {0} {1}: {2:.3f} ms, was {3:.3f} ms (REGRESSION)".format(resolution, name, median,
+                                                                                 baseline_median)
+
+    if len(regressions) == 0:
+        print "  No stage regressed"
+
+    return regressions
+
+
+# endregion
+
+# region Main
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the ball detection and the stages of the game loop")
+    parser.add_argument('--stages-only', action='store_true', help="only run the game loop stage benchmarks")
+    parser.add_argument('--frames', type=int, default=stage_frames,
+                        help="how many frames each trajectory is timed for")
+    parser.add_argument('--baseline', help="a baseline file to compare the stage timings against")
+    parser.add_argument('--save-baseline', help="saves the stage timings to this file, to use as a baseline")
+    parser.add_argument('--threshold', type=float, default=regression_threshold,
+                        help="how much slower a stage can get than the baseline (0.25 is 25%%)")
+    arguments = parser.parse_args()
+
+    color_range_lower, color_range_upper = load_color_range()
+
+    allocation_failures = []
+
+    if not arguments.stages_only:
+        benchmark_color_lookup(color_range_lower, color_range_upper)
+        benchmark_parallel_mask(color_range_lower, color_range_upper)
+        allocation_failures = benchmark_allocations(color_range_lower, color_range_upper)
+        benchmark_sprite_batch()
+
+    results = benchmark_stages(color_range_lower, color_range_upper, arguments.frames)
+
+    if arguments.save_baseline is not None:
+        with open(arguments.save_baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+
+    if arguments.baseline is not None:
+        with open(arguments.baseline, "r") as baseline_file:
+            baseline = json.load(baseline_file)
+
+        if len(compare_with_baseline(results, baseline, arguments.threshold)) > 0:
+            sys.exit(1)
+
+    if len(allocation_failures) > 0:
+        print "Detection allocated buffers after the first frame: {0}".format(", ".join(allocation_failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
+# endregion
@@ -0,0 +1,162 @@
+"""
+Box store
+
+Holds every box's state (position, velocity, rotation, color, size, and whether it is alive) in preallocated NumPy
+arrays, one entry (slot) per box, instead of one Python object per box. Moving every box toward the home base is then
+a single NumPy update per simulation step, with float positions.
+
+Removed boxes free their slot for the next new box. The arrays only grow (doubling) if every slot is in use.
+
+Xlantra1
+Copyright (c) 2017
+MIT License
+"""
+
+# region Imports
+import numpy as np
+
+# endregion
+
+
+# region Box Store Class
+class BoxStore(object):
+    # region Initialization
+    def __init__(self, capacity=64):
+        """
+        :param capacity: How many boxes there is room for before the arrays have to grow
+        """
+        self.capacity = 0
+
+        self.positions = np.zeros((0, 2))
+        self.previous_positions = np.zeros((0, 2))
+        self.velocities = np.zeros((0, 2))
+        self.rotations = np.zeros(0, dtype=np.int32)
+        self.colors = np.zeros((0, 3), dtype=np.uint8)
+        self.sizes = np.zeros((0, 2), dtype=np.int32)
+        self.paddings = np.zeros(0, dtype=np.int32)
+        self.alive = np.zeros(0, dtype=bool)
+
+        # Slots that aren't in use, with the lowest slot at the end (so it is used first)
+        self.free_slots = []
+        self.count = 0
+
+        self.grow(capacity)
+
+    # endregion
+
+    # region Slots
+    def grow(self, capacity):
+        """
+        Makes room for more boxes, keeping the boxes that are already in the store
+
+        :param capacity: The new number of slots
+        :return:         None
+        """
+        old_capacity = self.capacity
+
+        for name in ['positions', 'previous_positions', 'velocities', 'rotations', 'colors', 'sizes',
+                     'paddings', 'alive']:
+            old_array = getattr(self, name)
+            new_array = np.zeros((capacity,) + old_array.shape[1:], dtype=old_array.dtype)
+            new_array[:old_capacity] = old_array
+            setattr(self, name, new_array)
+
+        self.free_slots = range(capacity - 1, old_capacity - 1, -1) + self.free_slots
+        self.capacity = capacity
+
+    def add(self, position, size, padding, color):
+        """
+        Adds a box, in a free slot
+
+        :param position: The location of the top left of the box
+        :param size:     The size of the box's image
+        :param padding:  How much smaller the box's collision circle is than its image
+        :param color:    The color of the box (RGB)
+        :return:         The slot of the new box
+        """
+        if len(self.free_slots) == 0:
+            self.grow(self.capacity * 2)
+
+        slot = self.free_slots.pop()
+
+        self.positions[slot] = position
+        self.previous_positions[slot] = position
+        self.velocities[slot] = 0.0
+        self.rotations[slot] = 0
+        self.colors[slot] = color
+        self.sizes[slot] = size
+        self.paddings[slot] = padding
+        self.alive[slot] = True
+
+        self.count += 1
+
+        return slot
+
+    def remove(self, slots):
+        """
+        Removes boxes, freeing their slots
+
+        :param slots: The slots of the boxes to remove
+        :return:      None
+        """
+        for slot in slots:
+            if self.alive[slot]:
+                self.alive[slot] = False
+                self.free_slots.append(slot)
+                self.count -= 1
+
+    def get_alive(self):
+        """
+        The slots of every box that is alive
+
+        :return: An array of slots, in order
+        """
+        return np.flatnonzero(self.alive)
+
+    def get_color(self, slot):
+        """
+        The color of a box
+
+        :param slot: The slot of the box
+        :return:     The color (RGB, as a tuple so it can be used as a key)
+        """
+        return tuple(int(value) for value in self.colors[slot])
+
+    # endregion
+
+    # region Movement
+    def move_towards(self, point, speed):
+        """
+        Moves every box a part of the way toward a point (1 / 'speed' of the distance left), and turns it by a degree.
+
+        Every slot is updated (the slots that aren't alive are simply overwritten when they are next used), so the
+        update is done in place, with no new arrays.
+
+        :param point: The destination
+        :param speed: How many steps it takes a box to cover the distance (it slows down as it gets closer)
+        :return:      None
+        """
+        self.previous_positions[:] = self.positions
+
+        np.subtract(point, self.positions, out=self.velocities)
+        self.velocities /= speed
+
+        self.positions += self.velocities
+        np.maximum(self.positions, 0.0, out=self.positions)
+
+        self.rotations += 1
+        self.rotations %= 360
+
+    def get_draw_locations(self, slots, alpha):
+        """
+        Where boxes should be drawn, between where they were before the last simulation step and where they are now
+
+        :param slots: The slots of the boxes
+        :param alpha: How far through the next simulation step the frame is (0.0 is the previous location, 1.0 is the
+                      current location)
+        :return:      An array of locations (one row per box)
+        """
+        previous_positions = self.previous_positions[slots]
+        return previous_positions + (self.positions[slots] - previous_positions) * alpha
+    # endregion
+# endregion
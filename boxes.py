@@ -1,6 +1,11 @@
 """
 Box manager that handles the movement, rotation, and resizing of both the boxes and the home base
 
+'box_manager' moves everything by one simulation step. The boxes are kept in a BoxStore (NumPy arrays, see
+'box_store.py'), so every box is moved toward the home base in one update. Each box also keeps where it was before the
+step, so it can be drawn part way between the two when frames don't line up with steps (see
+'BoxStore.get_draw_locations')
+
 Xlantra1
 Copyright (c) 2017
 MIT License
@@ -8,10 +13,16 @@ MIT License
 
 # region Imports
 from collections import namedtuple
-from random import randint, uniform
+from itertools import product
+from random import choice, randint, uniform
 
 import pygame
 
+from asset_cache import AssetCache
+from box_store import BoxStore
+from rotation_cache import RotationCache
+from tint_cache import TintCache
+
 # endregion
 
 # region Named Tuples
@@ -27,7 +38,7 @@ class Box(object):
 
         self.screen = screen
 
-        self.boxes = []
+        self.store = BoxStore()
         self.numberOfBoxes = 0
 
         self.angle = 0
@@ -40,28 +51,28 @@ class Box(object):
 
         self.resolution_multiply = None
 
-    # endregion
+        # The colors new boxes are given (None for any color, see 'create_color_palette')
+        self.color_palette = None
 
-    # region Rotation
-    @staticmethod
-    def rotate_box(image, angle):
-        orig_rect = image.get_rect()
-        rot_image = pygame.transform.rotate(image, angle)
+        # The box and home images, loaded from disk once (and again only if the resolution changes)
+        self.assets = AssetCache()
 
-        rot_rect = orig_rect.copy()
-        rot_rect.center = rot_image.get_rect().center
-        rot_image = rot_image.subsurface(rot_rect).copy()
+        # Every rotation of the box and home images that has been drawn (the home base turns the same way as a box)
+        self.rotation_cache = RotationCache(self.rotate_box)
 
-        return rot_image
+        # The box image in every color that has been drawn (so a rotation can be drawn again without re-coloring)
+        self.tint_cache = TintCache(self.colorize)
 
+    # endregion
+
+    # region Rotation
     @staticmethod
-    def rotate_home(image, angle):
+    def rotate_box(image, angle):
         orig_rect = image.get_rect()
         rot_image = pygame.transform.rotate(image, angle)
 
         rot_rect = orig_rect.copy()
         rot_rect.center = rot_image.get_rect().center
-
         rot_image = rot_image.subsurface(rot_rect).copy()
 
         return rot_image
@@ -85,81 +96,93 @@ class Box(object):
         return image
 
     @staticmethod
-    def create_new_color():
+    def create_color_palette(levels):
+        """
+        Creates a palette of colors, with each of red, green and blue quantized to a number of evenly spaced levels.
+        Boxes given colors from the palette share their colored (and rotated) images.
+
+        :param levels: How many levels each of red, green and blue has (e.g. 4 gives 4 x 4 x 4 = 64 colors)
+        :return:       A list of colors (RGB)
+        """
+        values = [int(round(level * 255.0 / max(levels - 1, 1))) for level in xrange(levels)]
+
+        return list(product(values, repeat=3))
+
+    @staticmethod
+    def create_new_color(palette=None):
         """
         Creates a new random color, to spice up the look of the boxes
+
+        :param palette: A list of colors to pick from (None for any color)
+        :return:        The color (RGB)
         """
+        if palette:
+            return choice(palette)
+
         random_color_red = randint(0, 255)
         random_color_green = randint(0, 255)
         random_color_blue = randint(0, 255)
 
         return random_color_red, random_color_green, random_color_blue
 
-    @staticmethod
-    def resize_image(image, scale):
+    def get_box_image(self, slot):
         """
-        Takes an image and resize it based on the scale parameter
-
-        :param image: The image that should be resized
-        :param scale: The scale of which the image should be resized by (e.g. 1.0 is no resize, 0.5 is half scale)
-                            - If an image is 100 pixels wide, and scale is set to 0.5, then the final image will have a
-                              scale of 50 pixels wide
-                            - Both the width and height are scaled
-        :return:      The new image with the rotation applied
+        The image of a box, in its color and at its current rotation. Only drawn the first time that color and
+        rotation is needed, after that it comes from the 'rotation_cache'.
+
+        :param slot: The slot of the box in the store
+        :return:     The image of the box (shared, so don't draw on it)
         """
-        image_size = image.get_size()
-        new_image = pygame.transform.scale(
-            image, (int(image_size[0] * scale), int(image_size[1] * scale)))
+        box_color = self.store.get_color(slot)
 
-        return new_image
+        return self.rotation_cache.get(('square.png', 1.0, box_color), self.store.rotations[slot],
+                                       lambda: self.tint_cache.get(('square.png', 1.0), box_color,
+                                                                   lambda: self.assets.get_image('square.png')))
 
-    def move_towards_point(self, box_location, point):
+    def get_home_image(self, rotation):
         """
-        Calculates how much an object needs to move, based on it's current location and the destination location
+        The image of the home base, at a rotation (from the 'rotation_cache')
 
-        :param box_location: The current location of the box (as a tuple)
-        :param point:        The destination (as a tuple)
-        :return:             How much the box needs to move (can be positive or negative)
+        :param rotation: The rotation (in degrees)
+        :return:         The image of the home base (shared, so don't draw on it)
         """
-        dx, dy = (point[0] - box_location[0], box_location[1] - point[1])
-        step_x, step_y = (dx / self.box_speed, dy / self.box_speed)
+        scale = self.resolution_multiply[0]
 
-        return int(step_x), int(step_y)
+        return self.rotation_cache.get(('home.png', scale, (255, 255, 255)), rotation,
+                                       lambda: self.assets.get_image('home.png', scale))
 
     def box_manager(self):
         """
-        The manager for all the boxes. Handles the rotation, resizing, and movement of each box
+        The manager for all the boxes. Handles the rotation, resizing, and movement of each box, by one simulation step
 
         :return: None
         """
         screen_width, screen_height = self.screen.get_size()
+        if self.assets.set_resolution((screen_width, screen_height)):
+            self.tint_cache.clear()
+            self.rotation_cache.clear()
 
         """
-        Creates a new box, at a random location near the top, a random color, and adds it a the 'boxes' array.
+        The boxes were laid out against the camera frame's (height, width), before it was turned into a screen
+        oriented surface. The two are swapped here so the boxes keep the same starting area and destination.
+        """
+        screen_width, screen_height = screen_height, screen_width
 
-        This 'boxes' array is there to ensure that with each loop, the boxes are drawn, but not re-created.
-        Boxes are only re-created if there are less than the 'maxBoxes'.
         """
-        if len(self.boxes) < self.maxBoxes:
-            starting_angle = 0
+        Creates a new box, at a random location near the top, a random color, and adds it to the 'store'.
 
+        The 'store' is there to ensure that with each loop, the boxes are drawn, but not re-created.
+        Boxes are only re-created if there are less than the 'maxBoxes'.
+        """
+        if self.store.count < self.maxBoxes:
             random_width = randint(10, 50)
             random_y = randint(0 - self.padding, (screen_width - random_width))
             random_x = randint(0 - self.padding, 50 + self.padding)
 
-            box_image = pygame.image.load('square.png').convert_alpha()
-            new_box_image = box_image.copy()
-            box_color = self.create_new_color()
-            new_box_image = self.colorize(new_box_image, box_color)
+            box_image = self.assets.get_image('square.png')
 
-            box_data = BoxData(
-                new_box_image,
-                starting_angle,
-                (random_y,
-                 random_x),
-                box_color,
-                self.padding * 2, 0)
-            self.boxes.append(box_data)
+            self.store.add((random_y, random_x), box_image.get_size(), self.padding * 2,
+                           self.create_new_color(self.color_palette))
 
         """
         Creates the 'home' base near the bottom. This image doesn't move, but does rotate.
@@ -171,9 +194,7 @@ class Box(object):
         if len(self.home) == 0:
             starting_angle = 0
 
-            home_image = pygame.image.load('home.png').convert_alpha()
-            home_image = self.resize_image(home_image, self.resolution_multiply[0])
-            home_image = self.rotate_box(home_image, 0)
+            home_image = self.get_home_image(starting_angle)
 
             home_image_size = home_image.get_rect().size
 
@@ -198,12 +219,9 @@ class Box(object):
             self.home.append(home_data)
         else:
             for index, home in enumerate(self.home):
-                home_image = pygame.image.load('home.png').convert_alpha()
-                home_image = self.resize_image(home_image, self.resolution_multiply[0])
-
                 new_rotation = (home.rotation + 1) % 360
 
-                home_image = self.rotate_home(home_image, new_rotation)
+                home_image = self.get_home_image(new_rotation)
 
                 home_data = BoxData(
                     home_image,
@@ -214,46 +232,16 @@ class Box(object):
                     home.div)
                 self.home[index] = home_data
 
-        """ Loop through each box and re-calculates the rotation and location (as it moves toward the 'home' base). """
-        for index, box in enumerate(self.boxes):
-            box_image = pygame.image.load('square.png').convert_alpha()
-            box_image = self.colorize(box_image, box.color)
-
-            new_rotation = (box.rotation + 1) % 360
-
-            if self.home:
-                home = self.home[0]
-                home_location = home.location
-                home_size = home.img.get_rect()
-
-                move_towards_point = ((screen_height / 2) - (home_size.width / 2) + (home_size.width / home.div),
-                                      screen_width - (home_size.height / 3) + (home_size.height / home.div))
-
-                points_to_move = self.move_towards_point(box.location, move_towards_point)
-
-                new_location = (
-                    box.location[0] +
-                    points_to_move[0],
-                    box.location[1] -
-                    points_to_move[1])
-
-                new_location_x = new_location[0]
-                new_location_y = new_location[1]
-
-                if new_location_x < 0:
-                    new_location_x = 0
-
-                if new_location_y < 0:
-                    new_location_y = 0
+        """
+        Moves every box toward the 'home' base (a part of the distance left each step, so they slow down as they get
+        closer), and turns it by a degree. This is one update over the whole store, rather than a loop over each box.
+        """
+        if self.home:
+            home = self.home[0]
+            home_size = home.img.get_rect()
 
-                final_location = (new_location_x, new_location_y)
+            move_towards_point = ((screen_height / 2) - (home_size.width / 2) + (home_size.width / home.div),
+                                  screen_width - (home_size.height / 3) + (home_size.height / home.div))
 
-                new_box_image = self.rotate_box(box_image, new_rotation)
-                box_data = BoxData(
-                    new_box_image,
-                    new_rotation,
-                    final_location,
-                    box.color,
-                    box.padding, 0)
-                self.boxes[index] = box_data
+            self.store.move_towards(move_towards_point, self.box_speed)
 # endregion
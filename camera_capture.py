@@ -0,0 +1,168 @@
+"""
+Threaded camera capture
+
+Reads frames from the camera on its own thread and keeps only the newest few (tagged with their capture time), so the
+game loop never has to wait on the camera's exposure/transfer time.
+
+Frame images are recycled: dropped frames, and the images handed back by the game loop, are read into again
+
+Xlantra1
+Copyright (c) 2017
+MIT License
+"""
+
+# region Imports
+import threading
+import time
+from collections import deque
+from collections import namedtuple
+
+# endregion
+
+# region Named Tuples
+CapturedFrame = namedtuple('CapturedFrame', 'image timestamp frame_id')
+# endregion
+
+
+# region Camera Capture Class
+class CameraCapture(object):
+    # region Initialization
+    def __init__(self, video_camera, buffer_size=2, read_timeout=1.0, first_read_timeout=10.0):
+        """
+        :param video_camera:       The camera (which should be opened already by OpenCV)
+        :param buffer_size:        How many frames are kept before the oldest one is dropped
+        :param read_timeout:       How long (in seconds) 'read' will wait for a new frame before giving up
+        :param first_read_timeout: How long 'read' will wait for the first frame (cameras can take a while to warm
+                                   up, e.g. while the auto exposure settles)
+        """
+        self.camera = video_camera
+        self.read_timeout = read_timeout
+        self.first_read_timeout = first_read_timeout
+
+        self.frames = deque(maxlen=buffer_size)
+        self.free_images = []
+        self.dropped_frames = 0
+        self.last_timestamp = None
+
+        # Every frame read from the camera gets the next ID, so dropped frames show up as gaps
+        self.frame_count = 0
+        self.last_frame_id = None
+
+        self.running = False
+        self.failed = False
+
+        self._new_frame = threading.Condition(threading.Lock())
+        self._thread = None
+
+    # endregion
+
+    # region Thread
+    def start(self):
+        """
+        Starts the capture thread. The thread is a daemon, so it will never keep the game from exiting
+
+        :return: Itself, so it can be chained onto the constructor
+        """
+        if self._thread is not None:
+            return self
+
+        self.running = True
+        self._thread = threading.Thread(target=self._update, name='CameraCapture')
+        self._thread.daemon = True
+        self._thread.start()
+
+        return self
+
+    def _update(self):
+        """ Keeps reading from the camera until stopped, or until the camera stops returning frames """
+        while self.running:
+            """ Reads into a free image if there is one, otherwise the oldest frame is dropped and read into """
+            with self._new_frame:
+                image = None
+                if len(self.free_images) > 0:
+                    image = self.free_images.pop()
+                elif len(self.frames) == self.frames.maxlen:
+                    image = self.frames.popleft().image
+                    self.dropped_frames += 1
+
+            return_value, image = self.camera.read(image)
+            timestamp = time.time()
+
+            with self._new_frame:
+                if return_value is not True:
+                    self.failed = True
+                    self.running = False
+                    self._new_frame.notify_all()
+                    break
+
+                if len(self.frames) == self.frames.maxlen:
+                    self.free_images.append(self.frames.popleft().image)
+                    self.dropped_frames += 1
+
+                self.frame_count += 1
+                self.frames.append(CapturedFrame(image, timestamp, self.frame_count))
+                self._new_frame.notify_all()
+
+    def stop(self):
+        """ Stops the capture thread and waits for it to finish its current read """
+        self.running = False
+
+        if self._thread is not None:
+            self._thread.join(self.read_timeout)
+            self._thread = None
+
+    def release(self):
+        """ Stops the capture thread and releases the camera """
+        self.stop()
+        self.camera.release()
+
+    # endregion
+
+    # region Frames
+    def read_frame(self, image=None):
+        """
+        Takes the newest frame, dropping any older frames that were never read.
+        Waits for a new frame if the newest one has already been read.
+
+        :param image: The image from the previous read, which is no longer needed (it will be read into again)
+        :return:      A named tuple for CapturedFrame (image, capture time and ID), or None if the camera stopped
+        """
+        with self._new_frame:
+            if image is not None:
+                self.free_images.append(image)
+
+            if len(self.frames) == 0 and not self.failed:
+                self._new_frame.wait(self.read_timeout if self.last_frame_id is not None else self.first_read_timeout)
+
+            if len(self.frames) == 0:
+                return None
+
+            captured_frame = self.frames.pop()
+
+            self.dropped_frames += len(self.frames)
+            while len(self.frames) > 0:
+                self.free_images.append(self.frames.popleft().image)
+
+        self.last_timestamp = captured_frame.timestamp
+        self.last_frame_id = captured_frame.frame_id
+        return captured_frame
+
+    def read(self, image=None):
+        """
+        Same as 'read_frame', but returns the same values as OpenCV's 'VideoCapture.read', so it can be used in its
+        place. Like OpenCV, pass in the image from the previous read so it can be reused.
+
+        :param image: The image from the previous read, which is no longer needed
+        :return:      Whether or not a frame was read, and the frame itself
+        """
+        captured_frame = self.read_frame(image)
+        if captured_frame is None:
+            return False, None
+
+        return True, captured_frame.image
+
+    def set(self, prop_id, value):
+        """ Passes camera properties through to the OpenCV camera """
+        return self.camera.set(prop_id, value)
+    # endregion
+# endregion
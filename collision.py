@@ -0,0 +1,129 @@
+"""
+Collision
+
+Tests every box against every tracked ball, and against the home base, in one pass with NumPy (squared distances, so
+there is no per-box math in Python). The results are returned as indexes, so the boxes are only removed once the whole
+pass is done.
+
+Each ball is swept along the path it moved since the last test (a capsule: the segment between its previous and
+current position, with the ball's radius), so a fast ball can't pass through a box between two frames without
+hitting it.
+
+Xlantra1
+Copyright (c) 2017
+MIT License
+"""
+
+# region Imports
+import numpy as np
+
+# endregion
+
+# region Box Circles
+
+
+def get_box_circles(box_store):
+    """
+    The collision circle of every box that is alive: centered on its image, with its padding taken off the image's
+    width. Read straight from the store's arrays.
+
+    :param box_store: The BoxStore the boxes are kept in
+    :return:          The slots of the boxes (an N array), their centers (an N x 2 array) and their radii (an N array)
+    """
+    slots = box_store.get_alive()
+    sizes = box_store.sizes[slots]
+
+    centers = box_store.positions[slots] + sizes / 2.0
+    radii = (sizes[:, 0] - box_store.paddings[slots]) / 2.0
+
+    return slots, centers, radii
+
+
+# endregion
+
+# region Ball Paths
+
+
+def get_ball_paths(trackers, previous_positions, timestamp, upward_speed=100.0):
+    """
+    The path each tracked ball moved along since the last collision test, predicted to a time (e.g. when the frame will
+    be displayed).
+
+    Balls traveling up (faster than 'upward_speed') are skipped, so a ball can't remove any boxes in its path as it
+    travels up. Their previous position is forgotten while they are skipped, so the path never covers the way up either.
+
+    :param trackers:           The ball trackers that are tracking a ball
+    :param previous_positions: Where each ball was at the last collision test, by tracker
+    :param timestamp:          The time to predict the balls' positions for
+    :param upward_speed:       How fast a ball can travel up before it is skipped
+    :return:                   The balls for 'find_collisions', as a list of (previous x, previous y, x, y, radius), and
+                               where each ball is now by tracker (the previous positions for the next test)
+    """
+    balls = []
+    positions = {}
+
+    for tracker in trackers:
+        if tracker.velocity[1] > upward_speed:
+            continue
+
+        x, y = tracker.predict_position(timestamp)
+        previous_x, previous_y = previous_positions.get(tracker, (x, y))
+
+        balls.append((previous_x, previous_y, x, y, tracker.radius))
+        positions[tracker] = (x, y)
+
+    return balls, positions
+
+
+# endregion
+
+# region Collision
+
+
+def find_collisions(box_centers, box_radii, balls, home_center, home_radius):
+    """
+    Finds the boxes that were hit by a ball, and the boxes that reached the home base.
+    A box that was hit by a ball doesn't also count as reaching the home base.
+
+    :param box_centers: The centers of the boxes (an N x 2 array)
+    :param box_radii:   The radii of the boxes (an N array)
+    :param balls:       The balls, as a list of (previous x, previous y, x, y, radius)
+                            - A ball that hasn't moved (or has no previous position) has the same previous and current
+                              position
+    :param home_center: The center of the home base
+    :param home_radius: The radius of the home base
+    :return:            The indexes of the boxes that were hit, and the indexes of the boxes that reached the home base
+                        (indexes into 'box_centers', not store slots)
+    """
+    if len(box_radii) == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+    hit = np.zeros(len(box_radii), dtype=bool)
+
+    if len(balls) > 0:
+        balls = np.asarray(balls, dtype=np.float64).reshape(-1, 5)
+
+        starts = balls[:, 0:2]
+        paths = balls[:, 2:4] - starts
+        path_lengths = (paths ** 2).sum(axis=1)
+
+        """
+        Every box against every ball at once (boxes are rows, balls are columns).
+        Each box is measured to the closest point on the ball's path to it.
+        """
+        offsets = box_centers[:, np.newaxis, :] - starts[np.newaxis, :, :]
+        along_path = (offsets * paths[np.newaxis, :, :]).sum(axis=2) / np.maximum(path_lengths, 1e-12)
+        along_path = np.clip(along_path, 0.0, 1.0)
+
+        offsets -= along_path[:, :, np.newaxis] * paths[np.newaxis, :, :]
+        squared_distances = (offsets ** 2).sum(axis=2)
+        sum_radii = box_radii[:, np.newaxis] + balls[np.newaxis, :, 4]
+
+        hit = (squared_distances < sum_radii ** 2).any(axis=1)
+
+    home_offsets = box_centers - home_center
+    home_squared_distances = (home_offsets ** 2).sum(axis=1)
+    reached_home = home_squared_distances < (box_radii + home_radius) ** 2
+
+    return np.flatnonzero(hit), np.flatnonzero(reached_home & ~hit)
+# endregion
@@ -0,0 +1,148 @@
+"""
+Color lookup table
+
+Precomputes, for every possible RGB color, whether or not it is within the HSV color range. The mask for a frame can
+then be created straight from the camera pixels, without converting the whole frame to HSV first.
+
+Multiple color ranges (up to 8) can share the one table, with a bit for each range
+
+Xlantra1
+Copyright (c) 2017
+MIT License
+"""
+
+# region Imports
+import sys
+
+import cv2
+import numpy as np
+
+# endregion
+
+
+# region Color Lookup Class
+class ColorLookupTable(object):
+    # region Initialization
+    def __init__(self, color_range_lower, color_range_upper):
+        self.color_ranges = None
+
+        # One entry for every 24-bit color, indexed by the packed pixel value.
+        # Bit 'n' is set if the color is within color range 'n' (a single range uses 255, the same as 'cv2.inRange')
+        self.table = None
+
+        # Each pixel is packed into one index sized element, so that 'take' does not need to convert the indices
+        self.packed_pixels = None
+        self.packed_bytes = None
+
+        self.update(color_range_lower, color_range_upper)
+
+    # endregion
+
+    # region Table
+    @staticmethod
+    def pack_order():
+        """
+        The channel mapping used by 'cv2.mixChannels' to pack a pixel into the low 3 bytes of an index
+
+        :return: The 'fromTo' list for 'cv2.mixChannels'
+        """
+        item_size = np.dtype(np.intp).itemsize
+        if sys.byteorder == 'little':
+            return [0, 0, 1, 1, 2, 2]
+
+        return [0, item_size - 1, 1, item_size - 2, 2, item_size - 3]
+
+    def update(self, color_range_lower, color_range_upper):
+        """
+        Rebuilds the table for a single color range, but only if the color range has changed
+
+        :param color_range_lower: The lower HSV bound
+        :param color_range_upper: The upper HSV bound
+        :return:                  Whether or not the table was rebuilt
+        """
+        return self.update_ranges([(color_range_lower, color_range_upper)])
+
+    def update_ranges(self, color_ranges):
+        """
+        Rebuilds the table for multiple color ranges, but only if the color ranges have changed
+
+        :param color_ranges: A list of (lower, upper) HSV bounds, with at most 8 ranges
+        :return:             Whether or not the table was rebuilt
+        """
+        color_ranges = [(tuple(lower), tuple(upper)) for lower, upper in color_ranges]
+
+        if self.table is not None and color_ranges == self.color_ranges:
+            return False
+
+        if len(color_ranges) > 8:
+            raise ValueError("A color lookup table supports at most 8 color ranges")
+
+        self.color_ranges = color_ranges
+
+        if self.table is None:
+            self.table = np.empty(1 << 24, dtype=np.uint8)
+
+        """
+        The table is built a few blue values at a time, so only a small part of the colors is converted to HSV at once.
+        Each chunk is laid out as an RGB image in the same order as the packed pixels (red is the column, green and
+        blue the row).
+        """
+        blue_per_chunk = 16
+        chunk_rgb = np.empty((blue_per_chunk * 256, 256, 3), dtype=np.uint8)
+        chunk_rgb[..., 0] = np.arange(256, dtype=np.uint8)[np.newaxis, :]
+        chunk_rgb[..., 1] = np.tile(np.arange(256, dtype=np.uint8), blue_per_chunk)[:, np.newaxis]
+        chunk_hsv = np.empty_like(chunk_rgb)
+
+        for blue_start in xrange(0, 256, blue_per_chunk):
+            chunk_rgb[..., 2] = np.arange(blue_start, blue_start + blue_per_chunk,
+                                          dtype=np.uint8).repeat(256)[:, np.newaxis]
+            cv2.cvtColor(chunk_rgb, cv2.COLOR_RGB2HSV, dst=chunk_hsv)
+
+            chunk_table = self.table[blue_start << 16:(blue_start + blue_per_chunk) << 16].reshape(-1, 256)
+
+            if len(color_ranges) == 1:
+                chunk_table[:] = cv2.inRange(chunk_hsv, color_ranges[0][0], color_ranges[0][1])
+            else:
+                chunk_table[:] = 0
+                for index, (lower, upper) in enumerate(color_ranges):
+                    chunk_table |= cv2.inRange(chunk_hsv, lower, upper) & (1 << index)
+
+        return True
+
+    # endregion
+
+    # region Mask
+    def get_packed_pixels(self, height, width):
+        """
+        Returns the buffer that pixels are packed into, reallocating it only if it is too small
+
+        :param height: The height of the image
+        :param width:  The width of the image
+        :return:       The packed index view and the matching byte view, both cut to the size of the image
+        """
+        if (self.packed_pixels is None or self.packed_pixels.shape[0] < height or
+                self.packed_pixels.shape[1] < width):
+            self.packed_pixels = np.zeros((height, width), dtype=np.intp)
+            self.packed_bytes = self.packed_pixels.view(np.uint8).reshape(
+                height, width, np.dtype(np.intp).itemsize)
+
+        return self.packed_pixels[:height, :width], self.packed_bytes[:height, :width]
+
+    def create_mask(self, image, mask=None):
+        """
+        Creates the in-range mask for an RGB image, the same as 'cv2.inRange' on its HSV conversion.
+        With multiple color ranges, each pixel has the bits of every range it is within.
+
+        :param image: An RGB image (or part of one)
+        :param mask:  A contiguous array (the same height and width as the image) to write the mask into
+        :return:      The mask, where non-zero pixels are within the color range(s)
+        """
+        height, width = image.shape[:2]
+        packed_pixels, packed_bytes = self.get_packed_pixels(height, width)
+
+        cv2.mixChannels([image], [packed_bytes], self.pack_order())
+
+        """ Every packed pixel is a valid index, so 'clip' is safe (and lets 'take' write straight into the mask) """
+        return self.table.take(packed_pixels, out=mask, mode='clip')
+    # endregion
+# endregion
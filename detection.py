@@ -0,0 +1,422 @@
+"""
+Ball detection
+
+Finds the ball in a camera frame based on a color range. Once the ball has been found, only a small search window
+around where it is expected to be is processed, until it has been lost for too many frames.
+
+The mask can also be created from a downscaled frame, with the circle then refined on a small full resolution crop.
+
+Several balls, each with its own color profile, can also be found with a single shared mask.
+
+Every step writes into a buffer from a 'FrameBufferPool', so detection doesn't create new frame sized arrays
+
+Xlantra1
+Copyright (c) 2017
+MIT License
+"""
+
+# region Imports
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from frame_buffers import FrameBufferPool
+
+# endregion
+
+# region Named Tuples
+BallDetection = namedtuple('BallDetection', 'x y radius center')
+SearchWindow = namedtuple('SearchWindow', 'x1 y1 x2 y2')
+
+ColorProfile = namedtuple('ColorProfile', 'name lower upper')
+ProfileDetection = namedtuple('ProfileDetection', 'profile detection')
+# endregion
+
+
+# region Contours
+
+
+def circle_from_contour(c):
+    """
+    Calculates the circle that encloses a contour, and the contour's center of mass
+
+    :param c: The contour
+    :return:  A named tuple for BallDetection
+    """
+    ((ball_x, ball_y), ball_radius) = cv2.minEnclosingCircle(c)
+
+    M = cv2.moments(c)
+    if M['m00'] > 0:
+        center = (int(M['m10'] / M['m00']), int(M['m01'] / M['m00']))
+    else:
+        center = (int(ball_x), int(ball_y))
+
+    return BallDetection(ball_x, ball_y, ball_radius, center)
+
+
+def find_contours(color_mask, offset=(0, 0), contour_image=None):
+    """
+    Finds the outer contours of every object in the mask
+
+    :param color_mask:    The mask
+    :param offset:        Where the mask starts in the full frame, so the contours are in full frame coordinates
+    :param contour_image: An array the same size as the mask, to copy the mask into (older versions of OpenCV
+                          change the image that contours are found in)
+    :return:              A list of contours
+    """
+    if contour_image is None:
+        contour_image = color_mask.copy()
+    else:
+        np.copyto(contour_image, color_mask)
+
+    return cv2.findContours(contour_image,
+                            cv2.RETR_EXTERNAL,
+                            cv2.CHAIN_APPROX_SIMPLE,
+                            offset=offset)[-2]
+
+
+# endregion
+
+
+# region Ball Detector Class
+class BallDetector(object):
+    # region Initialization
+    def __init__(self, color_range_lower, color_range_upper):
+        self.color_range_lower = color_range_lower
+        self.color_range_upper = color_range_upper
+
+        # A 'ColorLookupTable' for the same color range, used instead of converting to HSV (if set)
+        self.color_lookup = None
+
+        self.buffer_pool = FrameBufferPool()
+
+        # A 'ParallelMaskStage', used to create the mask on several threads (if set)
+        self.parallel_mask = None
+
+        self.erode_iterations = 2
+        self.dilate_iterations = 2
+
+        # Scale that the mask is created at (e.g. 0.5 is half resolution), and whether or not to refine at full scale
+        self.scale = 1.0
+        self.refine = True
+        self.refine_padding = 4
+
+        # The ball is only followed (with a search window) once its radius is over this
+        self.min_radius = 10
+
+        self.search_window = True
+        self.search_window_padding = 20
+        self.search_window_velocity_scale = 2.0
+        self.max_lost_frames = 5
+
+        self.last_detection = None
+        self.velocity = (0.0, 0.0)
+        self.lost_frames = 0
+
+    # endregion
+
+    # region Search Window
+    def reset(self):
+        """ Forgets the ball, so that the next frame is a full-frame scan """
+        self.last_detection = None
+        self.velocity = (0.0, 0.0)
+        self.lost_frames = 0
+
+    def get_search_window(self, frame_width, frame_height):
+        """
+        Calculates the part of the frame the ball is expected to be in, based on where it was last seen and how fast it
+        was moving. The window grows for every frame that the ball is lost.
+
+        :param frame_width:  The width of the camera frame
+        :param frame_height: The height of the camera frame
+        :return:             A named tuple for SearchWindow, or None if the whole frame should be scanned
+        """
+        if self.search_window is not True or self.last_detection is None:
+            return None
+
+        if self.lost_frames > self.max_lost_frames:
+            return None
+
+        velocity_x, velocity_y = self.velocity
+        steps = self.lost_frames + 1
+
+        predicted_x = self.last_detection.x + velocity_x * steps
+        predicted_y = self.last_detection.y + velocity_y * steps
+
+        padding = self.last_detection.radius + self.search_window_padding * steps
+        padding_x = padding + abs(velocity_x) * self.search_window_velocity_scale * steps
+        padding_y = padding + abs(velocity_y) * self.search_window_velocity_scale * steps
+
+        x1 = max(0, int(predicted_x - padding_x))
+        y1 = max(0, int(predicted_y - padding_y))
+        x2 = min(frame_width, int(predicted_x + padding_x) + 1)
+        y2 = min(frame_height, int(predicted_y + padding_y) + 1)
+
+        if x2 - x1 <= 0 or y2 - y1 <= 0:
+            return None
+
+        return SearchWindow(x1, y1, x2, y2)
+
+    # endregion
+
+    # region Detection
+    def create_color_mask(self, image, scale=1.0):
+        """
+        Creates a mask of every pixel within the color range, with the noise removed
+
+        :param image: An RGB image (or part of one)
+        :param scale: The scale the image has been resized to, so that the noise removal is scaled to match
+        :return:      The mask, where white pixels are within the color range
+        """
+        erode_iterations = max(1, int(round(self.erode_iterations * scale)))
+        dilate_iterations = max(1, int(round(self.dilate_iterations * scale)))
+
+        if self.parallel_mask is not None and self.color_lookup is None:
+            return self.parallel_mask.create_color_mask(image, self.color_range_lower, self.color_range_upper,
+                                                        erode_iterations, dilate_iterations, self.buffer_pool)
+
+        height, width = image.shape[:2]
+        in_range = self.buffer_pool.get('in_range', height, width)
+
+        if self.color_lookup is not None:
+            in_range = self.color_lookup.create_mask(image, in_range)
+        else:
+            hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV, dst=self.buffer_pool.get('hsv', height, width, 3))
+            in_range = cv2.inRange(hsv, self.color_range_lower, self.color_range_upper, dst=in_range)
+
+        color_mask = cv2.erode(in_range, None, dst=self.buffer_pool.get('eroded', height, width),
+                               iterations=erode_iterations)
+        color_mask = cv2.dilate(color_mask, None, dst=self.buffer_pool.get('color_mask', height, width),
+                                iterations=dilate_iterations)
+
+        return color_mask
+
+    def find_largest_circle(self, color_mask, offset=(0, 0)):
+        """
+        Finds the largest object in the mask and the circle that encloses it
+
+        :param color_mask: The mask created by 'create_color_mask'
+        :param offset:     Where the mask starts in the full frame, so the results are in full frame coordinates
+        :return:           A named tuple for BallDetection, or None if there was nothing in the mask
+        """
+        height, width = color_mask.shape[:2]
+        contours = find_contours(color_mask, offset, self.buffer_pool.get('contours', height, width))
+
+        if len(contours) == 0:
+            return None
+
+        return circle_from_contour(max(contours, key=cv2.contourArea))
+
+    def detect_region(self, image, window):
+        """
+        Finds the largest object within a part of the frame, at full resolution
+
+        :param image:  The RGB camera frame
+        :param window: A named tuple for SearchWindow
+        :return:       A named tuple for BallDetection, or None if nothing was found
+        """
+        color_mask = self.create_color_mask(image[window.y1:window.y2, window.x1:window.x2])
+        return self.find_largest_circle(color_mask, (window.x1, window.y1))
+
+    def detect_scaled(self, image, window):
+        """
+        Finds the largest object within a part of the frame, using a downscaled copy of it.
+        If 'refine' is enabled, the circle is then found again on a full resolution crop around it.
+
+        :param image:  The RGB camera frame
+        :param window: A named tuple for SearchWindow
+        :return:       A named tuple for BallDetection (in full resolution coordinates), or None if nothing was found
+        """
+        scaled_width = max(1, int(round((window.x2 - window.x1) * self.scale)))
+        scaled_height = max(1, int(round((window.y2 - window.y1) * self.scale)))
+
+        scaled_image = cv2.resize(image[window.y1:window.y2, window.x1:window.x2], (scaled_width, scaled_height),
+                                  dst=self.buffer_pool.get('scaled', scaled_height, scaled_width, 3),
+                                  interpolation=cv2.INTER_AREA)
+
+        color_mask = self.create_color_mask(scaled_image, self.scale)
+        scaled_detection = self.find_largest_circle(color_mask)
+
+        if scaled_detection is None:
+            return None
+
+        detection = BallDetection(
+            window.x1 + scaled_detection.x / self.scale,
+            window.y1 + scaled_detection.y / self.scale,
+            scaled_detection.radius / self.scale,
+            (window.x1 + int(scaled_detection.center[0] / self.scale),
+             window.y1 + int(scaled_detection.center[1] / self.scale)))
+
+        if self.refine is not True:
+            return detection
+
+        frame_height, frame_width = image.shape[:2]
+        padding = detection.radius + (1.0 / self.scale) + self.refine_padding
+
+        refine_window = SearchWindow(
+            max(0, int(detection.x - padding)),
+            max(0, int(detection.y - padding)),
+            min(frame_width, int(detection.x + padding) + 1),
+            min(frame_height, int(detection.y + padding) + 1))
+
+        refined_detection = self.detect_region(image, refine_window)
+        if refined_detection is None:
+            return detection
+
+        return refined_detection
+
+    def detect(self, image):
+        """
+        Finds the ball in the frame. Only the search window is processed if the ball was recently found.
+
+        :param image: The RGB camera frame
+        :return:      A named tuple for BallDetection (position, radius and center of mass), or None if nothing was found
+        """
+        frame_height, frame_width = image.shape[:2]
+        self.buffer_pool.set_resolution(frame_width, frame_height)
+
+        window = self.get_search_window(frame_width, frame_height)
+        was_full_frame = window is None
+
+        if was_full_frame:
+            window = SearchWindow(0, 0, frame_width, frame_height)
+
+        if self.scale < 1.0:
+            detection = self.detect_scaled(image, window)
+        else:
+            detection = self.detect_region(image, window)
+
+        self.update(detection, was_full_frame)
+
+        return detection
+
+    def update(self, detection, was_full_frame):
+        """
+        Keeps track of the ball's last position and velocity, used for the next search window
+
+        :param detection:      The detection from this frame (or None)
+        :param was_full_frame: Whether or not the whole frame was scanned
+        :return:               None
+        """
+        if detection is None or detection.radius <= self.min_radius:
+            if was_full_frame:
+                self.reset()
+            else:
+                self.lost_frames += 1
+            return
+
+        if self.last_detection is not None:
+            steps = self.lost_frames + 1
+            self.velocity = ((detection.x - self.last_detection.x) / steps,
+                             (detection.y - self.last_detection.y) / steps)
+
+        self.last_detection = detection
+        self.lost_frames = 0
+    # endregion
+# endregion
+
+
+# region Multi Ball Detector Class
+class MultiBallDetector(object):
+    # region Initialization
+    def __init__(self, color_profiles):
+        """
+        :param color_profiles: A list of ColorProfile named tuples (at most 8)
+        """
+        self.color_profiles = color_profiles
+
+        # A 'ColorLookupTable' with a color range for each profile, used instead of converting to HSV (if set)
+        self.color_lookup = None
+
+        self.buffer_pool = FrameBufferPool()
+
+        self.erode_iterations = 2
+        self.dilate_iterations = 2
+
+        self.min_radius = 10
+        self.max_balls_per_profile = 2
+
+    # endregion
+
+    # region Detection
+    def create_profile_labels(self, image):
+        """
+        Labels every pixel with the color profiles it is within. Bit 'n' is set for profile 'n'.
+        The frame is only converted to HSV once, no matter how many profiles there are.
+
+        :param image: An RGB image
+        :return:      The labels
+        """
+        labels = self.buffer_pool.get('labels')
+
+        if self.color_lookup is not None:
+            return self.color_lookup.create_mask(image, labels)
+
+        hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV, dst=self.buffer_pool.get('hsv', channels=3))
+        in_range = self.buffer_pool.get('in_range')
+
+        labels.fill(0)
+        for index, profile in enumerate(self.color_profiles):
+            cv2.inRange(hsv, profile.lower, profile.upper, dst=in_range)
+            cv2.bitwise_or(labels, 1 << index, dst=labels, mask=in_range)
+
+        return labels
+
+    def classify_contour(self, labels, c):
+        """
+        Works out which color profile a contour belongs to, by which profile most of its pixels are within
+
+        :param labels: The labels from 'create_profile_labels'
+        :param c:      The contour
+        :return:       The index of the color profile
+        """
+        x, y, width, height = cv2.boundingRect(c)
+        contour_labels = labels[y:y + height, x:x + width]
+
+        if len(self.color_profiles) == 1:
+            return 0
+
+        profile_pixels = [np.count_nonzero(contour_labels & (1 << index))
+                          for index in xrange(len(self.color_profiles))]
+
+        return profile_pixels.index(max(profile_pixels))
+
+    def detect(self, image):
+        """
+        Finds the largest balls of each color profile. All profiles share one mask, noise removal and contour pass.
+
+        :param image: The RGB camera frame
+        :return:      A list of ProfileDetection named tuples (the profile index and the BallDetection)
+        """
+        frame_height, frame_width = image.shape[:2]
+        self.buffer_pool.set_resolution(frame_width, frame_height)
+
+        labels = self.create_profile_labels(image)
+
+        color_mask = cv2.threshold(labels, 0, 255, cv2.THRESH_BINARY, dst=self.buffer_pool.get('in_range'))[1]
+        color_mask = cv2.erode(color_mask, None, dst=self.buffer_pool.get('eroded'),
+                               iterations=self.erode_iterations)
+        color_mask = cv2.dilate(color_mask, None, dst=self.buffer_pool.get('color_mask'),
+                                iterations=self.dilate_iterations)
+
+        profile_detections = [[] for _ in self.color_profiles]
+
+        for c in find_contours(color_mask, contour_image=self.buffer_pool.get('contours')):
+            detection = circle_from_contour(c)
+            if detection.radius <= self.min_radius:
+                continue
+
+            profile = self.classify_contour(labels, c)
+            profile_detections[profile].append((cv2.contourArea(c), detection))
+
+        detections = []
+        for profile, found in enumerate(profile_detections):
+            found.sort(key=lambda area_detection: area_detection[0], reverse=True)
+
+            for _, detection in found[:self.max_balls_per_profile]:
+                detections.append(ProfileDetection(profile, detection))
+
+        return detections
+    # endregion
+# endregion
@@ -0,0 +1,84 @@
+"""
+Frame buffer pool
+
+Holds the arrays used for each step of the ball detection (color conversion, masks, noise removal, etc.), so they are
+only allocated once instead of every frame. The buffers are re-created only when the camera resolution changes
+
+Xlantra1
+Copyright (c) 2017
+MIT License
+"""
+
+# region Imports
+import numpy as np
+
+# endregion
+
+
+# region Frame Buffer Pool Class
+class FrameBufferPool(object):
+    # region Initialization
+    def __init__(self, width=0, height=0):
+        self.width = width
+        self.height = height
+
+        # Flat buffers, keyed by name and type. Views of any size up to the full frame are cut from these.
+        self.buffers = {}
+
+        # How many times a buffer has been allocated (should stop going up once the game is running)
+        self.allocations = 0
+
+    # endregion
+
+    # region Buffers
+    def set_resolution(self, width, height):
+        """
+        Sets the resolution of the frames. All of the buffers are dropped if it has changed.
+
+        :param width:  The width of the camera frame
+        :param height: The height of the camera frame
+        :return:       Whether or not the resolution changed
+        """
+        if width == self.width and height == self.height:
+            return False
+
+        self.width = width
+        self.height = height
+        self.buffers = {}
+
+        return True
+
+    def get(self, name, height=None, width=None, channels=1, dtype=np.uint8):
+        """
+        Returns a buffer for the named step, in the requested size (the full frame size, if not set).
+
+        The view is cut from the start of a flat buffer, so it is always contiguous (which OpenCV and NumPy need in
+        order to write straight into it) no matter its size.
+
+        :param name:     The name of the buffer (e.g. 'hsv')
+        :param height:   The height of the view
+        :param width:    The width of the view
+        :param channels: The number of channels (1 for masks)
+        :param dtype:    The type of the buffer
+        :return:         A view of the buffer, with the shape (height, width) or (height, width, channels)
+        """
+        if height is None:
+            height = self.height
+        if width is None:
+            width = self.width
+
+        size = height * width * channels
+        key = (name, np.dtype(dtype).str)
+
+        flat_buffer = self.buffers.get(key)
+        if flat_buffer is None or flat_buffer.size < size:
+            flat_buffer = np.empty(max(size, self.width * self.height * channels), dtype=dtype)
+            self.buffers[key] = flat_buffer
+            self.allocations += 1
+
+        if channels == 1:
+            return flat_buffer[:size].reshape(height, width)
+
+        return flat_buffer[:size].reshape(height, width, channels)
+    # endregion
+# endregion
@@ -0,0 +1,246 @@
+"""
+Frame recording and replay
+
+Records the camera's raw frames (and the time each was captured) to a memory mapped file, and replays them later in
+place of the camera. The game, the detection and the benchmarks can then be run on exactly the same frames, on
+machines with no camera attached.
+
+Both classes can be used in place of OpenCV's 'VideoCapture' (they have the same 'read', 'set' and 'release').
+
+The recording is a single file: a small header, then the capture time of every frame, then the frames themselves
+(BGR, exactly as the camera gave them). The replay serves each frame as a view of the file, so nothing is copied.
+
+Reference => https://docs.scipy.org/doc/numpy/reference/generated/numpy.memmap.html
+
+Xlantra1
+Copyright (c) 2017
+MIT License
+"""
+
+# region Imports
+import time
+
+import numpy as np
+
+# endregion
+
+# region Global Variables
+# The header is (file marker, max frames, frame count, height, width, channels, unused, unused)
+header_marker = 0x50544252
+header_size = 8
+header_bytes = header_size * 8
+# endregion
+
+# region Recording File
+
+
+def get_frames_offset(max_frames):
+    """
+    Where the frames start in a recording file (they come after the header and the timestamps)
+
+    :param max_frames: The number of frames the file was created for
+    :return:           The offset (in bytes)
+    """
+    return header_bytes + max_frames * 8
+
+
+def open_recording(path, mode='r', max_frames=0, frame_shape=None):
+    """
+    Opens (or creates) a recording file as memory mapped arrays
+
+    :param path:        The path of the recording
+    :param mode:        'r' to read an existing recording, or 'w+' to create a new one
+    :param max_frames:  The number of frames to make room for (only for new recordings)
+    :param frame_shape: The (height, width, channels) of the frames (only for new recordings)
+    :return:            The header, timestamps and frames arrays
+    """
+    if mode == 'r':
+        header = np.memmap(path, dtype=np.int64, mode='r', shape=(header_size,))
+        if header[0] != header_marker:
+            raise ValueError("'{0}' is not a frame recording".format(path))
+
+        max_frames = int(header[1])
+        frame_shape = tuple(int(value) for value in header[3:6])
+    else:
+        """ The file is created at its full size up front, so every frame is written straight into it """
+        recording_file = open(path, 'wb')
+        recording_file.truncate(get_frames_offset(max_frames) + max_frames * int(np.prod(frame_shape)))
+        recording_file.close()
+
+        header = np.memmap(path, dtype=np.int64, mode='r+', shape=(header_size,))
+        header[:] = (header_marker, max_frames, 0) + tuple(frame_shape) + (0, 0)
+
+    timestamps = np.memmap(path, dtype=np.float64, mode=header.mode, offset=header_bytes, shape=(max_frames,))
+    frames = np.memmap(path, dtype=np.uint8, mode=header.mode, offset=get_frames_offset(max_frames),
+                       shape=(max_frames,) + tuple(frame_shape))
+
+    return header, timestamps, frames
+
+
+# endregion
+
+
+# region Frame Recorder Class
+class FrameRecorder(object):
+    # region Initialization
+    def __init__(self, video_camera, path, max_frames=1800):
+        """
+        :param video_camera: The camera to record (an OpenCV camera, 'CameraCapture', etc.)
+        :param path:         The path of the recording (it is replaced if it already exists)
+        :param max_frames:   The most frames that are recorded, the rest are passed through without being recorded
+        """
+        self.camera = video_camera
+        self.path = path
+        self.max_frames = max_frames
+
+        # The file is only created on the first frame, once the size of the frames is known
+        self.header = None
+        self.timestamps = None
+        self.frames = None
+
+        self.frame_count = 0
+        self.last_timestamp = None
+
+    # endregion
+
+    # region Frames
+    def read(self, image=None):
+        """
+        Reads a frame from the camera, and records it if there is still room
+
+        :param image: The image from the previous read, which is no longer needed
+        :return:      Whether or not a frame was read, and the frame itself
+        """
+        return_value, image = self.camera.read(image)
+
+        self.last_timestamp = getattr(self.camera, 'last_timestamp', None) or time.time()
+
+        if return_value is not True or self.frame_count >= self.max_frames:
+            return return_value, image
+
+        if self.header is None:
+            self.header, self.timestamps, self.frames = open_recording(self.path, 'w+', self.max_frames,
+                                                                       image.shape)
+
+        """ Frames that are a different size to the first one can't be replayed, so they aren't recorded """
+        if image.shape == self.frames.shape[1:]:
+            self.frames[self.frame_count] = image
+            self.timestamps[self.frame_count] = self.last_timestamp
+
+            self.frame_count += 1
+            self.header[2] = self.frame_count
+
+        return return_value, image
+
+    def set(self, prop_id, value):
+        """ Passes camera properties through to the camera """
+        return self.camera.set(prop_id, value)
+
+    def release(self):
+        """ Writes the recording to disk, and releases the camera """
+        if self.header is not None:
+            self.frames.flush()
+            self.timestamps.flush()
+            self.header.flush()
+
+        self.camera.release()
+    # endregion
+# endregion
+
+
+# region Replay Source Class
+class ReplaySource(object):
+    # region Initialization
+    def __init__(self, path, real_time=True, loop=False):
+        """
+        :param path:      The path of the recording
+        :param real_time: Whether the frames are served at the pace they were recorded, or as fast as they are read
+        :param loop:      Whether the replay starts again from the first frame once it reaches the end
+        """
+        self.path = path
+        self.real_time = real_time
+        self.loop = loop
+
+        self.header, self.timestamps, self.frames = open_recording(path)
+        self.frame_count = int(self.header[2])
+
+        """ Each loop starts one (average) frame after the last frame of the loop before """
+        self.loop_duration = 0.0
+        if self.frame_count > 1:
+            recorded_time = self.timestamps[self.frame_count - 1] - self.timestamps[0]
+            self.loop_duration = recorded_time * self.frame_count / (self.frame_count - 1)
+
+        self.frame_index = -1
+        self.loop_count = 0
+        self.start_time = None
+        self.dropped_frames = 0
+        self.last_timestamp = None
+        self.last_frame_id = None
+
+    # endregion
+
+    # region Frames
+    def get_frame_time(self, frame_index):
+        """
+        The time a frame was captured, moved so the first frame of the replay (or of this loop of it) is at the time the
+        replay (or the loop) started
+
+        :param frame_index: The index of the frame
+        :return:            The time (in seconds, comparable to 'time.time()')
+        """
+        return self.start_time + (self.timestamps[frame_index] - self.timestamps[0])
+
+    def read(self, image=None):
+        """
+        Serves the next frame, as a view of the recording (it must not be written to).
+
+        When looping, the frame IDs and capture times carry on from the loop before, so they keep increasing.
+
+        In real time, this waits until the next frame is due, and skips any frames that are already late (the same as
+        a camera that was read too slowly). Otherwise, every frame is served straight away.
+
+        :param image: Not used (the frames are always in the recording)
+        :return:      Whether or not a frame was read, and the BGR frame itself
+        """
+        if self.frame_count == 0:
+            return False, None
+
+        if self.start_time is None:
+            self.start_time = time.time()
+
+        frame_index = self.frame_index + 1
+
+        if frame_index >= self.frame_count:
+            if not self.loop:
+                return False, None
+
+            frame_index = 0
+            self.loop_count += 1
+            self.start_time += self.loop_duration
+
+        if self.real_time:
+            now = time.time()
+
+            while frame_index + 1 < self.frame_count and self.get_frame_time(frame_index + 1) <= now:
+                frame_index += 1
+                self.dropped_frames += 1
+
+            wait_time = self.get_frame_time(frame_index) - now
+            if wait_time > 0:
+                time.sleep(wait_time)
+
+        self.frame_index = frame_index
+        self.last_timestamp = self.get_frame_time(frame_index)
+        self.last_frame_id = self.loop_count * self.frame_count + frame_index + 1
+
+        return True, self.frames[frame_index]
+
+    def set(self, prop_id, value):
+        """ The recorded frames can't be changed, so this does nothing """
+        return False
+
+    def release(self):
+        """ Nothing to release, the recording is closed when the replay is no longer used """
+        pass
+    # endregion
+# endregion
@@ -0,0 +1,184 @@
+"""
+HUD
+
+Draws the text (lives, score, FPS, tracking status...) and the static overlays (the rings over the home base) on top
+of the game, from cached surfaces:
+    - Text is only rendered again when the text changes, not every frame
+    - Overlays are drawn once for each resolution, onto a surface just big enough to hold them
+    - Circles (e.g. the box collision circles) are drawn once for each radius, color and thickness
+
+Xlantra1
+Copyright (c) 2017
+MIT License
+"""
+
+# region Imports
+from collections import OrderedDict
+
+import pygame
+
+# endregion
+
+# region Overlays
+
+
+def create_ring_overlay(center, rings, resolution):
+    """
+    Draws rings around a point, onto a surface that only covers the part of the rings that is on screen
+
+    :param center:     The center of the rings (can be off screen)
+    :param rings:      The rings, as a list of (color, radius, thickness)
+    :param resolution: The size of the screen (width, height)
+    :return:           The surface, and where its top left is drawn on the screen
+    """
+    outer_radius = max(radius for _, radius, _ in rings)
+
+    area = pygame.Rect(center[0] - outer_radius, center[1] - outer_radius, outer_radius * 2 + 1, outer_radius * 2 + 1)
+    area = area.clip(pygame.Rect((0, 0), resolution))
+
+    overlay = pygame.Surface(area.size, pygame.SRCALPHA)
+    for color, radius, thickness in rings:
+        pygame.draw.circle(overlay, color, (center[0] - area.x, center[1] - area.y), radius, thickness)
+
+    return overlay, area.topleft
+
+
+def create_base_rings(resolution, multiply_height):
+    """
+    Draws the two circles covering the base (for looks)
+
+    :param resolution:      The size of the screen (width, height)
+    :param multiply_height: The resolution multiplier for the height (the rings were sized for 1080p)
+    :return:                The surface, and where its top left is drawn on the screen
+    """
+    return create_ring_overlay((resolution[0] / 2, resolution[1] + 25),
+                               [((255, 255, 0), int(160 * multiply_height), 5),
+                                ((255, 0, 0), int(150 * multiply_height), 5)], resolution)
+
+
+# endregion
+
+
+# region HUD Class
+class Hud(object):
+    # region Initialization
+    def __init__(self, font):
+        """
+        :param font: The Pygame font the text is rendered with
+        """
+        self.font = font
+
+        # The text items by name, as [text format, location, color, text, rendered text]
+        self.items = OrderedDict()
+
+        # The overlays by name, as [create overlay function, surface, location]
+        self.overlays = OrderedDict()
+
+        # The circle images, by (radius, color, thickness)
+        self.circles = {}
+
+        # The resolution the overlays were drawn for
+        self.resolution = None
+
+        self.render_count = 0
+
+    # endregion
+
+    # region Items
+    def add_text(self, name, text_format, location, color=(255, 255, 0)):
+        """
+        Adds a line of text, which is shown once it has a value (see 'set_value')
+
+        :param name:        The name of the item
+        :param text_format: How the value is shown (e.g. "Lives: {0}")
+        :param location:    Where the top left of the text is drawn
+        :param color:       The color of the text
+        :return:            None
+        """
+        self.items[name] = [text_format, location, color, None, None]
+
+    def set_value(self, name, value):
+        """
+        Sets the value of a line of text. The text is only rendered again if it has changed.
+
+        :param name:  The name of the item (items that haven't been added are ignored)
+        :param value: The new value
+        :return:      None
+        """
+        item = self.items.get(name)
+        if item is None:
+            return
+
+        text = item[0].format(value)
+        if text != item[3]:
+            item[3] = text
+            item[4] = self.font.render(text, 1, item[2])
+            self.render_count += 1
+
+    def add_overlay(self, name, create_overlay):
+        """
+        Adds an overlay that doesn't change (other than with the resolution)
+
+        :param name:           The name of the overlay
+        :param create_overlay: A function that draws the overlay for a resolution, as create_overlay(resolution), and
+                               returns the surface and where to draw it
+        :return:               None
+        """
+        self.overlays[name] = [create_overlay, None, None]
+
+    def get_circle_image(self, radius, color, thickness=0):
+        """
+        An image of a circle, drawn the first time it is asked for
+
+        :param radius:    The radius of the circle
+        :param color:     The color of the circle
+        :param thickness: The thickness of the circle's line (0 to fill it)
+        :return:          The image (its center is at (radius, radius))
+        """
+        key = (radius, color, thickness)
+
+        circle_image = self.circles.get(key)
+        if circle_image is None:
+            circle_image = pygame.Surface((radius * 2 + 1, radius * 2 + 1), pygame.SRCALPHA)
+            pygame.draw.circle(circle_image, color, (radius, radius), radius, thickness)
+            self.circles[key] = circle_image
+
+        return circle_image
+
+    # endregion
+
+    # region Drawing
+    def set_resolution(self, resolution):
+        """
+        Draws the overlays again if the resolution has changed
+
+        :param resolution: The size of the screen (width, height)
+        :return:           None
+        """
+        resolution = tuple(resolution)
+        if resolution == self.resolution:
+            return
+
+        self.resolution = resolution
+        self.circles.clear()
+
+        for overlay in self.overlays.values():
+            overlay[1], overlay[2] = overlay[0](resolution)
+
+    def draw(self, screen):
+        """
+        Draws the overlays, then the text
+
+        :param screen: The surface to draw on
+        :return:       None
+        """
+        self.set_resolution(screen.get_size())
+
+        for _, overlay, location in self.overlays.values():
+            screen.blit(overlay, location)
+
+        for item in self.items.values():
+            if item[4] is not None:
+                screen.blit(item[4], item[1])
+    # endregion
+# endregion
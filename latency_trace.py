@@ -0,0 +1,193 @@
+"""
+Latency trace
+
+Follows each camera frame from the moment it was captured, through detection, collision and rendering, to the
+display flip that shows it, and saves the timeline in Chrome's trace event format. Open the file in 'chrome://tracing'
+(or https://ui.perfetto.dev) to see how long frames waited to be picked up, how long each stage took, and how far
+behind the camera the screen was.
+
+Every frame is shown on three tracks:
+    - camera:    when the frame was captured
+    - game loop: each stage of the game loop, as it ran on the frame
+    - frames:    the frame's whole life, split into 'queued' (captured, but not yet picked up) and 'processing'
+
+Reference => https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU
+
+Xlantra1
+Copyright (c) 2017
+MIT License
+"""
+
+# region Imports
+import json
+import os
+import time
+from collections import deque
+
+# endregion
+
+# region Global Variables
+# The track (thread id) each kind of event is shown on
+camera_track = 1
+game_loop_track = 2
+frames_track = 3
+
+track_names = {
+    camera_track: 'camera',
+    game_loop_track: 'game loop',
+    frames_track: 'frames'
+}
+# endregion
+
+
+# region Latency Trace Class
+class LatencyTrace(object):
+    # region Initialization
+    def __init__(self, max_frames=3000):
+        """
+        :param max_frames: How many of the most recent frames are kept in the trace
+        """
+        self.process_id = os.getpid()
+
+        # The trace starts at the capture of the first frame
+        self.start_time = None
+
+        # The events of each frame, with the oldest frames dropped once there are 'max_frames'
+        self.frames = deque(maxlen=max_frames)
+
+        self.frame_id = None
+        self.capture_timestamp = None
+        self.pickup_timestamp = None
+        self.events = None
+
+    # endregion
+
+    # region Events
+    def get_trace_time(self, timestamp):
+        """
+        Converts a time into the trace's time
+
+        :param timestamp: The time (in seconds, from 'time.time()')
+        :return:          The time since the trace started (in microseconds)
+        """
+        return int((timestamp - self.start_time) * 1000000.0)
+
+    def create_event(self, name, phase, timestamp, track, **args):
+        """
+        Creates a trace event
+
+        :param name:      The name of the event
+        :param phase:     The type of event ('X' for a span, 'i' for an instant, 'b'/'e' for the start/end of a frame)
+        :param timestamp: When the event happened (in seconds, from 'time.time()')
+        :param track:     The track the event is shown on
+        :param args:      Extra values that are shown with the event
+        :return:          The event, as a dictionary
+        """
+        args['frame_id'] = self.frame_id
+
+        return {'name': name, 'ph': phase, 'ts': self.get_trace_time(timestamp), 'pid': self.process_id,
+                'tid': track, 'args': args}
+
+    def begin_frame(self, frame_id, capture_timestamp, pickup_timestamp=None):
+        """
+        Starts following a frame
+
+        :param frame_id:          The frame's ID
+        :param capture_timestamp: When the frame was captured
+        :param pickup_timestamp:  When the game loop picked the frame up (now, if not set)
+        :return:                  None
+        """
+        if self.start_time is None:
+            self.start_time = capture_timestamp
+
+        self.frame_id = frame_id
+        self.capture_timestamp = capture_timestamp
+        self.pickup_timestamp = pickup_timestamp or time.time()
+
+        event = self.create_event('capture', 'i', capture_timestamp, camera_track)
+        event['s'] = 't'
+
+        self.events = [event]
+        self.frames.append(self.events)
+
+    def add_span(self, name, start, end):
+        """
+        Adds a stage of the game loop that ran on the current frame
+
+        :param name:  The name of the stage
+        :param start: When the stage started
+        :param end:   When the stage finished
+        :return:      None
+        """
+        if self.events is None:
+            return
+
+        event = self.create_event(name, 'X', start, game_loop_track)
+        event['dur'] = self.get_trace_time(end) - event['ts']
+        self.events.append(event)
+
+    def add_instant(self, name, **args):
+        """
+        Marks something that happened while the current frame was being processed (e.g. a box being hit)
+
+        :param name: The name of the event
+        :param args: Extra values that are shown with the event
+        :return:     None
+        """
+        if self.events is None:
+            return
+
+        event = self.create_event(name, 'i', time.time(), game_loop_track, **args)
+        event['s'] = 't'
+        self.events.append(event)
+
+    def finish_frame(self, display_timestamp=None):
+        """
+        Finishes following the current frame, once it has been shown
+
+        :param display_timestamp: When the frame was shown (now, if not set)
+        :return:                  None
+        """
+        if self.events is None:
+            return
+
+        display_timestamp = display_timestamp or time.time()
+        latency = (display_timestamp - self.capture_timestamp) * 1000.0
+
+        """ The frame spans are async events, since a frame can be captured before the one before it is shown """
+        for name, phase, timestamp in [('frame', 'b', self.capture_timestamp),
+                                       ('queued', 'b', self.capture_timestamp),
+                                       ('queued', 'e', self.pickup_timestamp),
+                                       ('processing', 'b', self.pickup_timestamp),
+                                       ('processing', 'e', display_timestamp),
+                                       ('frame', 'e', display_timestamp)]:
+            event = self.create_event(name, phase, timestamp, frames_track, latency_ms=latency)
+            event['cat'] = 'frame'
+            event['id'] = self.frame_id
+            self.events.append(event)
+
+        self.events = None
+
+    # endregion
+
+    # region Saving
+    def save(self, path):
+        """
+        Saves the trace to a JSON file
+
+        :param path: The path of the file
+        :return:     None
+        """
+        trace_events = []
+        for track, track_name in track_names.items():
+            trace_events.append({'name': 'thread_name', 'ph': 'M', 'pid': self.process_id, 'tid': track,
+                                 'args': {'name': track_name}})
+
+        for events in self.frames:
+            trace_events.extend(events)
+
+        trace_file = open(path, "w")
+        json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, trace_file)
+        trace_file.close()
+    # endregion
+# endregion
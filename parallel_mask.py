@@ -0,0 +1,129 @@
+"""
+Parallel mask stage
+
+Creates the ball mask on several cores at once. The frame is split into horizontal stripes, each stripe is converted,
+thresholded and has its noise removed on a thread pool (OpenCV releases the GIL while it works), then the stripes are
+stitched back together for the contour search.
+
+Each stripe is processed with a few extra rows above and below it, so the noise removal at the edges of a stripe
+sees the same pixels it would on the full frame. The result is the same as doing the whole frame at once.
+
+Xlantra1
+Copyright (c) 2017
+MIT License
+"""
+
+# region Imports
+from multiprocessing.pool import ThreadPool
+
+import cv2
+
+# endregion
+
+
+# region Parallel Mask Stage Class
+class ParallelMaskStage(object):
+    # region Initialization
+    def __init__(self, workers):
+        """
+        :param workers: The number of threads (and stripes) to use
+        """
+        self.workers = workers
+
+        # Images shorter than this many rows per stripe are done on a single thread instead
+        self.min_stripe_height = 32
+
+        self.pool = ThreadPool(workers)
+
+    def close(self):
+        """ Stops the worker threads """
+        self.pool.close()
+        self.pool.join()
+
+    # endregion
+
+    # region Stripes
+    @staticmethod
+    def get_overlap(erode_iterations, dilate_iterations):
+        """
+        How many extra rows each stripe needs, so that the edges of the stripe are the same as on the full frame.
+        Each iteration of erode or dilate (with the default 3x3 kernel) looks one row further.
+
+        :param erode_iterations:  The number of erode iterations
+        :param dilate_iterations: The number of dilate iterations
+        :return:                  The number of extra rows above and below each stripe
+        """
+        return erode_iterations + dilate_iterations
+
+    def get_stripes(self, height, overlap):
+        """
+        Splits the rows of an image into stripes
+
+        :param height:  The height of the image
+        :param overlap: The number of extra rows above and below each stripe
+        :return:        A list of (stripe start, stripe end, padded start, padded end) rows
+        """
+        stripe_count = max(1, min(self.workers, height / self.min_stripe_height))
+
+        stripes = []
+        for index in xrange(stripe_count):
+            stripe_start = height * index / stripe_count
+            stripe_end = height * (index + 1) / stripe_count
+
+            stripes.append((stripe_start, stripe_end,
+                            max(0, stripe_start - overlap), min(height, stripe_end + overlap)))
+
+        return stripes
+
+    # endregion
+
+    # region Mask
+    def create_color_mask(self, image, color_range_lower, color_range_upper, erode_iterations, dilate_iterations,
+                          buffer_pool):
+        """
+        Creates a mask of every pixel within the color range, with the noise removed, one stripe per thread
+
+        :param image:             An RGB image (or part of one)
+        :param color_range_lower: The lower HSV bound
+        :param color_range_upper: The upper HSV bound
+        :param erode_iterations:  The number of erode iterations
+        :param dilate_iterations: The number of dilate iterations
+        :param buffer_pool:       A 'FrameBufferPool' (each stripe gets its own buffers from it)
+        :return:                  The mask, where white pixels are within the color range
+        """
+        height, width = image.shape[:2]
+        color_mask = buffer_pool.get('color_mask', height, width)
+
+        overlap = self.get_overlap(erode_iterations, dilate_iterations)
+        stripes = self.get_stripes(height, overlap)
+
+        def create_stripe_mask(stripe_index):
+            stripe_start, stripe_end, padded_start, padded_end = stripes[stripe_index]
+            padded_height = padded_end - padded_start
+
+            hsv = cv2.cvtColor(image[padded_start:padded_end], cv2.COLOR_RGB2HSV,
+                               dst=buffer_pool.get('stripe_hsv_%d' % stripe_index, padded_height, width, 3))
+
+            stripe_mask = cv2.inRange(hsv, color_range_lower, color_range_upper,
+                                      dst=buffer_pool.get('stripe_in_range_%d' % stripe_index, padded_height, width))
+            stripe_mask = cv2.erode(stripe_mask, None,
+                                    dst=buffer_pool.get('stripe_eroded_%d' % stripe_index, padded_height, width),
+                                    iterations=erode_iterations)
+            stripe_mask = cv2.dilate(stripe_mask, None,
+                                     dst=buffer_pool.get('stripe_dilated_%d' % stripe_index, padded_height, width),
+                                     iterations=dilate_iterations)
+
+            """ Only the rows that belong to this stripe are copied, the extra rows belong to its neighbours """
+            color_mask[stripe_start:stripe_end] = stripe_mask[stripe_start - padded_start:stripe_end - padded_start]
+
+        """ The buffers are fetched on this thread first, so the pool is never changed by two threads at once """
+        for stripe_index, (stripe_start, stripe_end, padded_start, padded_end) in enumerate(stripes):
+            for name, channels in [('stripe_hsv_%d', 3), ('stripe_in_range_%d', 1),
+                                   ('stripe_eroded_%d', 1), ('stripe_dilated_%d', 1)]:
+                buffer_pool.get(name % stripe_index, padded_end - padded_start, width, channels)
+
+        self.pool.map(create_stripe_mask, xrange(len(stripes)))
+
+        return color_mask
+    # endregion
+# endregion
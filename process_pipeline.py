@@ -0,0 +1,267 @@
+"""
+Process based capture and detection pipeline
+
+Runs the camera and the ball detection in a separate worker process, so they never compete with the game (Pygame
+rendering, box management, etc.) for the GIL. The worker reads frames straight into a ring of frame slots in shared
+memory and writes its detection result next to each one. The game only ever takes the newest slot, and no pixel data
+is pickled or copied between the two processes.
+
+Slots are handed out so that the worker never writes into the newest slot, or the slot the game is currently reading,
+which means the ring needs at least 3 slots.
+
+The worker is always forked from the game, which has no '__main__' guard (so a spawned worker would start the game
+again). On platforms that can't fork (e.g. Windows) the pipeline can't be used.
+
+Reference => https://docs.python.org/2/library/multiprocessing.html#shared-ctypes-objects
+
+Xlantra1
+Copyright (c) 2017
+MIT License
+"""
+
+# region Imports
+import ctypes
+import multiprocessing
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from detection import BallDetection
+from detection import BallDetector
+
+# endregion
+
+# region Global Variables
+# Each slot's result is (frame id, capture time, found, x, y, radius, center x, center y)
+result_size = 8
+# endregion
+
+
+# region Worker
+
+
+def get_fork_context():
+    """
+    What the worker process and its shared memory are created with, so the worker is forked even where forking isn't
+    the default
+
+    :return: The 'fork' context (or the 'multiprocessing' module itself on Python 2), or None if this platform can't
+             fork
+    """
+    if hasattr(multiprocessing, 'get_all_start_methods'):
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            return None
+
+        return multiprocessing.get_context('fork')
+
+    if sys.platform == 'win32':
+        return None
+
+    return multiprocessing
+
+
+def run_worker(camera_index, width, height, detector_settings, shared_frames, shared_results, latest_slot,
+               reading_slot, new_frame, stop_event, failed):
+    """
+    The worker process. Reads the camera into a free slot, detects the ball, then publishes the slot as the newest.
+
+    :param camera_index:      The index of the camera to open
+    :param width:             The width of the frames
+    :param height:            The height of the frames
+    :param detector_settings: The settings for the 'BallDetector' (as a dictionary of its attributes)
+    :param shared_frames:     The shared memory for the frame slots
+    :param shared_results:    The shared memory for the detection results
+    :param latest_slot:       The shared index of the newest slot
+    :param reading_slot:      The shared index of the slot the game is reading
+    :param new_frame:         The condition that the game waits on for a new frame (it also guards both indexes)
+    :param stop_event:        Set by the game when the worker should stop
+    :param failed:            Set by the worker if the camera stops returning frames
+    :return:                  None
+    """
+    frames = np.frombuffer(shared_frames, dtype=np.uint8).reshape(-1, height, width, 3)
+    results = np.frombuffer(shared_results, dtype=np.float64).reshape(-1, result_size)
+
+    camera = cv2.VideoCapture(camera_index)
+    camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+
+    ball_detector = BallDetector(detector_settings['color_range_lower'], detector_settings['color_range_upper'])
+    for name, value in detector_settings.items():
+        setattr(ball_detector, name, value)
+
+    rgb_frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame_id = 0
+
+    try:
+        while not stop_event.is_set():
+            with new_frame:
+                slot = 0
+                while slot == latest_slot.value or slot == reading_slot.value:
+                    slot += 1
+
+            slot_frame = frames[slot]
+            return_value, image = camera.read(slot_frame)
+            timestamp = time.time()
+
+            if return_value is not True:
+                failed.value = True
+                with new_frame:
+                    new_frame.notify_all()
+                break
+
+            """ OpenCV only reads straight into the slot if the camera gave the size that was asked for """
+            if image.shape != slot_frame.shape:
+                cv2.resize(image, (width, height), dst=slot_frame)
+            elif image.ctypes.data != slot_frame.ctypes.data:
+                np.copyto(slot_frame, image)
+
+            cv2.cvtColor(slot_frame, cv2.COLOR_BGR2RGB, dst=rgb_frame)
+            detection = ball_detector.detect(rgb_frame)
+
+            frame_id += 1
+            if detection is None:
+                results[slot] = (frame_id, timestamp, 0, 0, 0, 0, 0, 0)
+            else:
+                results[slot] = (frame_id, timestamp, 1, detection.x, detection.y, detection.radius,
+                                 detection.center[0], detection.center[1])
+
+            with new_frame:
+                latest_slot.value = slot
+                new_frame.notify_all()
+    finally:
+        camera.release()
+
+
+# endregion
+
+
+# region Process Pipeline Class
+class ProcessPipeline(object):
+    # region Initialization
+    def __init__(self, camera_index, width, height, detector_settings, slot_count=3, read_timeout=1.0,
+                 first_read_timeout=10.0):
+        """
+        Only works where the worker can be forked (see 'get_fork_context')
+
+        :param camera_index:       The index of the camera to open (it is opened by the worker, not this process)
+        :param width:              The width of the frames
+        :param height:             The height of the frames
+        :param detector_settings:  The settings for the worker's 'BallDetector' (as a dictionary of its attributes)
+        :param slot_count:         How many frame slots are in the ring (at least 3)
+        :param read_timeout:       How long (in seconds) 'read' will wait for a new frame before giving up
+        :param first_read_timeout: How long 'read' will wait for the first frame (which also covers starting the worker
+                                   and opening the camera)
+        """
+        self.camera_index = camera_index
+        self.width = width
+        self.height = height
+        self.detector_settings = detector_settings
+        self.slot_count = max(3, slot_count)
+        self.read_timeout = read_timeout
+        self.first_read_timeout = first_read_timeout
+
+        self.context = get_fork_context()
+
+        frame_size = width * height * 3
+        self.shared_frames = self.context.RawArray(ctypes.c_uint8, self.slot_count * frame_size)
+        self.shared_results = self.context.RawArray(ctypes.c_double, self.slot_count * result_size)
+
+        self.frames = np.frombuffer(self.shared_frames, dtype=np.uint8).reshape(self.slot_count, height, width, 3)
+        self.results = np.frombuffer(self.shared_results, dtype=np.float64).reshape(self.slot_count, result_size)
+
+        self.latest_slot = self.context.RawValue(ctypes.c_int, -1)
+        self.reading_slot = self.context.RawValue(ctypes.c_int, -1)
+        self.new_frame = self.context.Condition()
+        self.stop_event = self.context.Event()
+        self.failed = self.context.RawValue(ctypes.c_bool, False)
+
+        self.process = None
+
+        self.last_frame_id = 0
+        self.last_timestamp = None
+        self.last_detection = None
+
+    # endregion
+
+    # region Process
+    def start(self):
+        """
+        Starts the worker process
+
+        :return: Itself, so it can be chained onto the constructor
+        """
+        if self.process is not None:
+            return self
+
+        self.process = self.context.Process(
+            target=run_worker,
+            name='ProcessPipeline',
+            args=(self.camera_index, self.width, self.height, self.detector_settings, self.shared_frames,
+                  self.shared_results, self.latest_slot, self.reading_slot, self.new_frame, self.stop_event,
+                  self.failed))
+        self.process.daemon = True
+        self.process.start()
+
+        return self
+
+    def release(self):
+        """ Asks the worker to stop, and makes sure it has (so the camera is released) """
+        if self.process is None:
+            return
+
+        self.stop_event.set()
+        self.process.join(self.read_timeout)
+
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+        self.process = None
+
+    # endregion
+
+    # region Frames
+    def read(self, image=None):
+        """
+        Takes the newest frame, waiting for one if the newest has already been read.
+        Returns the same values as OpenCV's 'VideoCapture.read', so it can be used in its place.
+
+        The frame is a view of shared memory, and stays valid until the next 'read'. The detection result for the
+        frame is in 'last_detection' and its capture time is in 'last_timestamp'.
+
+        :param image: Not used (the frames are always in shared memory)
+        :return:      Whether or not a frame was read, and the BGR frame itself
+        """
+        deadline = time.time() + (self.read_timeout if self.last_timestamp is not None else self.first_read_timeout)
+
+        with self.new_frame:
+            while True:
+                slot = self.latest_slot.value
+                if slot != -1 and self.results[slot][0] > self.last_frame_id:
+                    break
+
+                remaining = deadline - time.time()
+                if self.failed.value or remaining <= 0:
+                    return False, None
+
+                self.new_frame.wait(remaining)
+
+            self.reading_slot.value = slot
+
+        frame_id, timestamp, found, x, y, radius, center_x, center_y = self.results[slot]
+
+        self.last_frame_id = int(frame_id)
+        self.last_timestamp = timestamp
+        self.last_detection = None
+        if found:
+            self.last_detection = BallDetection(x, y, radius, (int(center_x), int(center_y)))
+
+        return True, self.frames[slot]
+
+    def set(self, prop_id, value):
+        """ Camera properties are set by the worker, so this does nothing """
+        return False
+    # endregion
+# endregion
@@ -3,13 +3,18 @@ Main game
 
 Handles the creation of sprites, the display of the objects, collision between objects, tracking of lives, and more
 
+Can also be run headless (no window, and as fast as possible) on a recording or a synthetic scene, e.g. for soak tests:
+
+    python protect_the_base.py --headless --synthetic --duration 3600 --seed 1 --metrics metrics.json
+
 Xlantra1
 Copyright (c) 2017
 MIT License
 """
 
 # region Imports
-import math
+import argparse
+import random
 import time
 import os
 from collections import deque
@@ -20,13 +25,68 @@ import numpy as np
 import pygame
 from pygame.locals import *
 
+from ball_tracker import BallTracker
+from ball_tracker import MultiBallTracker
 from boxes import Box
+from camera_capture import CameraCapture
+from collision import find_collisions
+from collision import get_ball_paths
+from collision import get_box_circles
+from color_lookup import ColorLookupTable
+from detection import BallDetector
+from detection import ColorProfile
+from detection import MultiBallDetector
+from frame_buffers import FrameBufferPool
+from frame_recording import FrameRecorder
+from frame_recording import ReplaySource
+from parallel_mask import ParallelMaskStage
+from process_pipeline import ProcessPipeline
+from process_pipeline import get_fork_context
+from quality_controller import QualityController
+from quality_controller import QualityLevel
+from quality_controller import create_quality_levels
+from latency_trace import LatencyTrace
+from stage_metrics import StageMetrics
+from hud import Hud
+from hud import create_base_rings
 from hue import BallGameHue
 from run_animation import Explosion
+from sprite_batch import SpriteBatch
+from synthetic_scene import SyntheticScene
+
+try:
+    import resource
+except ImportError:
+    resource = None
 
 # endregion
 
 # region Global Variables
+# region Command Line
+parser = argparse.ArgumentParser(description="Protect The Base")
+parser.add_argument('--headless', action='store_true',
+                    help="runs with no window and no display flips, as fast as possible")
+parser.add_argument('--duration', type=float, default=0.0,
+                    help="how long to run for (in seconds) before exiting (0 runs until 'ESC' is pressed)")
+parser.add_argument('--seed', type=int, help="seeds the boxes and the synthetic scene, so runs can be repeated")
+parser.add_argument('--replay', help="replays a recording in place of the camera")
+parser.add_argument('--synthetic', action='store_true', help="uses a synthetic scene in place of the camera")
+parser.add_argument('--metrics', help="saves the stage metrics (as JSON) to this file on exit")
+arguments = parser.parse_args()
+
+# Runs with no window (SDL's dummy video driver) and never flips the display
+headless = arguments.headless
+if headless is True:
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+
+# How long to run for (in seconds) before exiting (0 runs until 'ESC' is pressed)
+run_duration = arguments.duration
+
+seed = arguments.seed
+if seed is not None:
+    random.seed(seed)
+# endregion
+
 # region Hue
 enable_hue = False
 
@@ -42,6 +102,10 @@ ball_color = (137, 193, 255)  # 0xFF
 ball_x = 0
 ball_y = 0
 ball_radius = 0
+
+# Only searches around the last known position of the ball, until it has been lost for 'ball_max_lost_frames'
+ball_search_window = True
+ball_max_lost_frames = 5
 # endregion
 
 # region Drag Trail
@@ -53,6 +117,13 @@ drag_trail_thickness = 2.5
 # region Color Range
 color_range_lower = None
 color_range_upper = None
+
+# Every color profile in 'settings.txt' (the first one is also 'color_range_lower' and 'color_range_upper')
+color_profiles = []
+
+# Creates the ball mask from a precomputed RGB lookup table, instead of converting each frame to HSV
+use_color_lookup = False
+color_lookup = None
 # endregion
 
 # region Font
@@ -65,43 +136,194 @@ screen_is_color = True
 # endregion
 
 # region Lives
-lives = 10
+starting_lives = 10
+lives = starting_lives
+
+# How many times the lives ran out, in headless runs that start again instead of ending (see 'run_duration')
+lives_resets = 0
+
+# How many boxes have been hit
+score = 0
+# endregion
+
+# region HUD
+# Extra text shown on screen (only rendered again when it changes, so they don't cost a font render every frame)
+show_score = False
+show_fps = False
+show_tracking_status = False
 # endregion
 
 # region Boxes
 draw_box_collision_circle = False
 
+# How much memory (in megabytes) the rotated box and home images can take up. Each box color takes up to 360 rotations.
+rotation_cache_megabytes = 64
+
+# Box colors are picked from a palette with this many levels of red, green and blue (e.g. 4 for 64 colors), so boxes of
+# the same color share their images. None picks any color.
+box_color_levels = None
+
 initializedBoxes = False
 box_class = None
 # endregion
 
 # region Collision
-lastFall = None
-collision_check_skip = False
+# Collision is skipped while the ball's vertical speed (in pixels per second) is over this
+ball_upward_speed = 100.0
+
+# Where each tracked ball was at the last collision test. Collision covers the whole path the ball moved along since
+# then (not just where it is now), so fast throws can't skip over boxes between frames.
+previous_ball_positions = {}
+# endregion
+
+# region Ball Tracker
+ball_tracker = BallTracker()
+
+# Tracks the largest 'max_balls_per_profile' balls of every color profile in 'settings.txt', instead of a single ball
+multi_ball_tracking = False
+max_balls_per_profile = 2
+
+multi_ball_tracker = MultiBallTracker()
+
+# Runs detection every Nth frame, with the tracker predicting the ball's position in between
+detection_interval = 1
+
+# Predicts the ball's position for when the frame is displayed, based on how long frames take to get to the screen
+predict_display_latency = True
+display_latency = 0.0
 # endregion
 
 # region Clock
 clock = pygame.time.Clock()
+
+# The boxes, the home base and the explosions move in fixed steps of this many per second, whatever the frame rate
+simulation_rate = 30.0
+simulation_step = 1.0 / simulation_rate
+
+# The most steps that are run in one frame, so a slow frame doesn't make the next one even slower
+max_simulation_steps = 5
+
+# How much time hasn't been simulated yet, and how far through the next step that is (for drawing the boxes)
+simulation_time = simulation_step
+simulation_alpha = 1.0
+
+# How frames are paced: 'uncapped', 'vsync' (waits for the display to refresh) or 'fixed' (at most 'max_frame_rate')
+frame_pacing = 'uncapped'
+max_frame_rate = 60
+
+if headless is True:
+    frame_pacing = 'uncapped'
 # endregion
 
 # region Frame Rate
 num_frames = 0
 # endregion
 
+# region Metrics
+# Records how long each stage of the game loop takes, over the most recent frames
+stage_metrics = StageMetrics()
+
+# Shows each stage's percentiles on screen (toggled with 'M' while playing)
+show_metrics_overlay = False
+
+# Where the metrics are saved when 'S' is pressed while playing, and on exit if 'save_metrics_on_exit' is set
+metrics_csv_path = "metrics.csv"
+metrics_json_path = "metrics.json"
+save_metrics_on_exit = False
+
+if arguments.metrics is not None:
+    metrics_csv_path = None
+    metrics_json_path = arguments.metrics
+    save_metrics_on_exit = True
+
+# Follows every frame from capture to the display, and saves the timeline here on exit (None to not trace).
+# Open it in 'chrome://tracing'. Only the most recent 'trace_max_frames' are kept.
+trace_path = None
+trace_max_frames = 3000
+
+latency_trace = None
+if trace_path is not None:
+    latency_trace = LatencyTrace(trace_max_frames)
+    stage_metrics.trace = latency_trace
+# endregion
+
+# region Adaptive Quality
+# Lowers the detection and trail quality when frames take longer than 'frame_budget' (in milliseconds), and raises it
+# again once there is headroom. Every change is logged.
+adaptive_quality = False
+frame_budget = 1000.0 / 30.0
+
+quality_controller = None
+# endregion
+
 # region Screen Resolution
 built_on_resolution_width = 1920
 built_on_resolution_height = 1080
 
 screen_resolution_width = 1280
 screen_resolution_height = 720
+
+# Scale the ball is detected at (e.g. 0.5 or 0.25), then refined on a small full resolution crop
+detection_scale = 1.0
+detection_refine = True
+
+# Creates the ball mask in horizontal stripes on this many threads (0 is off)
+mask_workers = 0
 # endregion
 
 # region Camera
 camera_index = 0
-camera = cv2.VideoCapture(camera_index)
 
-camera.set(cv2.CAP_PROP_FRAME_WIDTH, screen_resolution_width)
-camera.set(cv2.CAP_PROP_FRAME_HEIGHT, screen_resolution_height)
+# Reads the camera on its own thread, so the game loop only ever picks up the newest frame
+threaded_capture = True
+capture_buffer_size = 2
+
+# Reads the camera and detects the ball in a separate process (sharing frames through shared memory) instead.
+# Only a single ball is tracked in this mode, and the worker has to be forked (so not on Windows).
+use_process_pipeline = False
+process_pipeline_slots = 3
+
+# Records the camera's frames to this file, so they can be replayed later (None to not record)
+record_frames_path = None
+record_max_frames = 1800
+
+# Replays a recording in place of the camera (None to use the camera). Recordings are looped when running for a set time
+replay_frames_path = arguments.replay
+replay_real_time = True
+replay_loop = run_duration > 0
+
+# Uses a synthetic scene (a ball following a scripted path, see 'synthetic_scene.py') in place of the camera
+synthetic_frames = arguments.synthetic
+
+if headless is True:
+    replay_real_time = False
+
+if use_process_pipeline is True and get_fork_context() is None:
+    print "THE PROCESS PIPELINE NEEDS FORK, WHICH THIS PLATFORM DOESN'T HAVE...READING THE CAMERA IN THIS PROCESS"
+    use_process_pipeline = False
+
+if replay_frames_path is not None:
+    camera = ReplaySource(replay_frames_path, replay_real_time, replay_loop)
+
+    """ The recording is read in this process, and frames served faster than real time have no display latency """
+    use_process_pipeline = False
+    if replay_real_time is not True:
+        predict_display_latency = False
+elif synthetic_frames is True:
+    """ The scene is created once the color range is loaded (its ball is drawn in the middle of the range) """
+    use_process_pipeline = False
+    predict_display_latency = False
+elif use_process_pipeline is not True:
+    camera = cv2.VideoCapture(camera_index)
+
+    camera.set(cv2.CAP_PROP_FRAME_WIDTH, screen_resolution_width)
+    camera.set(cv2.CAP_PROP_FRAME_HEIGHT, screen_resolution_height)
+
+    if threaded_capture is True:
+        camera = CameraCapture(camera, capture_buffer_size).start()
+
+    if record_frames_path is not None:
+        camera = FrameRecorder(camera, record_frames_path, record_max_frames)
 # endregion
 
 # region Deques
@@ -112,12 +334,38 @@ pts = deque(maxlen=64)
 is_fullscreen = False
 
 screen_width, screen_height = screen_resolution_width, screen_resolution_height
-final_screen = pygame.display.set_mode((screen_width, screen_height))
+display_flags = pygame.FULLSCREEN if is_fullscreen else 0
 
-if is_fullscreen:
-    final_screen = pygame.display.set_mode((screen_width, screen_height), pygame.FULLSCREEN)
+if frame_pacing == 'vsync':
+    """
+    Pygame 2 only waits for the display with a 'SCALED' (or OpenGL) screen, and raises an error otherwise. Pygame 1
+    can't wait for the display at all (there is no 'vsync' argument). Either way, frames are capped instead.
+    """
+    try:
+        final_screen = pygame.display.set_mode((screen_width, screen_height),
+                                               display_flags | getattr(pygame, 'SCALED', 0), vsync=1)
+    except (TypeError, pygame.error):
+        print "VSYNC NOT SUPPORTED...CAPPING AT {0} FPS".format(max_frame_rate)
+        frame_pacing = 'fixed'
+
+if frame_pacing != 'vsync':
+    final_screen = pygame.display.set_mode((screen_width, screen_height), display_flags)
 
 pygame.display.set_caption('Protect The Base', '')
+
+# The camera frame is copied into this surface every frame (it is only re-created if the frame size changes)
+camera_surface = None
+# endregion
+
+# region Sprite Batch
+# The boxes, home base and explosions are drawn with one blit call per frame
+sprite_batch = SpriteBatch()
+# endregion
+
+# region Frame Buffers
+# The camera is read into the same image every frame, and every detection step has its own buffer in the pool
+camera_image = None
+buffer_pool = FrameBufferPool(screen_resolution_width, screen_resolution_height)
 # endregion
 
 # region Explosion Animations
@@ -134,7 +382,7 @@ running = True
 # endregion
 
 # region Named Tuples
-Frame = namedtuple('Frame', 'org pg')
+Frame = namedtuple('Frame', 'org pg timestamp frame_id')
 
 
 # endregion
@@ -143,42 +391,122 @@ Frame = namedtuple('Frame', 'org pg')
 # region Color Range
 
 
+def create_color_profile(profile_name, profile_settings):
+    """
+    Creates a color profile from the settings that were loaded for it
+
+    :param profile_name:     The name of the profile
+    :param profile_settings: The 'v1_min' through 'v3_max' settings, as a dictionary
+    :return:                 A named tuple for ColorProfile
+    """
+    return ColorProfile(
+        profile_name,
+        (int(profile_settings["v1_min"]), int(profile_settings["v2_min"]), int(profile_settings["v3_min"])),
+        (int(profile_settings["v1_max"]), int(profile_settings["v2_max"]), int(profile_settings["v3_max"])))
+
+
 def load_color_range():
+    """
+    Loads the color range(s) from the 'settings.txt' file.
+
+    The first (or only) range is the default profile. Other profiles can follow it, each starting with a
+    'profile => <name>' line and followed by their own 'v1_min' through 'v3_max' settings.
+    """
     if not os.path.exists("settings.txt"):
         print "MISSING COLOR RANGE FILE (settings.txt)"
         exit()
 
-    global color_range_lower, color_range_upper
+    global color_range_lower, color_range_upper, color_profiles, color_lookup
 
-    v1_min = v2_min = v3_min = v1_max = v2_max = v3_max = None
+    color_profiles = []
+
+    profile_name = "default"
+    profile_settings = {}
 
     settings_file = open("settings.txt", "r")
     all_lines = settings_file.readlines()
     for setting_value in all_lines:
-        if setting_value.startswith("v1_min => "):
-            v1_min = setting_value.replace("v1_min => ", "").replace("\n", "")
+        setting_value = setting_value.replace("\n", "")
+
+        if setting_value.startswith("profile => "):
+            if len(profile_settings) > 0:
+                color_profiles.append(create_color_profile(profile_name, profile_settings))
+
+            profile_name = setting_value.replace("profile => ", "")
+            profile_settings = {}
 
-        if setting_value.startswith("v2_min => "):
-            v2_min = setting_value.replace("v2_min => ", "").replace("\n", "")
+        elif " => " in setting_value:
+            setting_name, value = setting_value.split(" => ")
+            profile_settings[setting_name] = value
 
-        if setting_value.startswith("v3_min => "):
-            v3_min = setting_value.replace("v3_min => ", "").replace("\n", "")
+    settings_file.close()
 
-        if setting_value.startswith("v1_max => "):
-            v1_max = setting_value.replace("v1_max => ", "").replace("\n", "")
+    if len(profile_settings) > 0:
+        color_profiles.append(create_color_profile(profile_name, profile_settings))
 
-        if setting_value.startswith("v2_max => "):
-            v2_max = setting_value.replace("v2_max => ", "").replace("\n", "")
+    if len(color_profiles) > 8:
+        print "TOO MANY COLOR PROFILES IN settings.txt (MAX 8)"
+        exit()
+
+    color_range_lower = color_profiles[0].lower
+    color_range_upper = color_profiles[0].upper
 
-        if setting_value.startswith("v3_max => "):
-            v3_max = setting_value.replace("v3_max => ", "").replace("\n", "")
+    """ The lookup table is only rebuilt if the color range(s) have changed """
+    if use_color_lookup is True:
+        if multi_ball_tracking is True:
+            color_ranges = [(profile.lower, profile.upper) for profile in color_profiles]
+        else:
+            color_ranges = [(color_range_lower, color_range_upper)]
 
-    color_range_lower = (int(v1_min), int(v2_min), int(v3_min))
-    color_range_upper = (int(v1_max), int(v2_max), int(v3_max))
+        if color_lookup is None:
+            color_lookup = ColorLookupTable(color_range_lower, color_range_upper)
+
+        color_lookup.update_ranges(color_ranges)
 
 
 load_color_range()
 
+ball_detector = BallDetector(color_range_lower, color_range_upper)
+ball_detector.search_window = ball_search_window
+ball_detector.max_lost_frames = ball_max_lost_frames
+ball_detector.scale = detection_scale
+ball_detector.refine = detection_refine
+ball_detector.color_lookup = color_lookup
+ball_detector.buffer_pool = buffer_pool
+
+parallel_mask = None
+if mask_workers > 0:
+    parallel_mask = ParallelMaskStage(mask_workers)
+    ball_detector.parallel_mask = parallel_mask
+
+multi_ball_detector = MultiBallDetector(color_profiles)
+multi_ball_detector.max_balls_per_profile = max_balls_per_profile
+multi_ball_detector.color_lookup = color_lookup
+multi_ball_detector.buffer_pool = buffer_pool
+
+""" The worker process gets its own copy of the ball detector's settings """
+if use_process_pipeline is True:
+    multi_ball_tracking = False
+
+    camera = ProcessPipeline(camera_index, screen_resolution_width, screen_resolution_height, {
+        'color_range_lower': color_range_lower,
+        'color_range_upper': color_range_upper,
+        'search_window': ball_search_window,
+        'max_lost_frames': ball_max_lost_frames,
+        'scale': detection_scale,
+        'refine': detection_refine
+    }, process_pipeline_slots).start()
+
+if synthetic_frames is True:
+    camera = SyntheticScene(screen_resolution_width, screen_resolution_height,
+                            [(l + u) / 2 for l, u in zip(color_range_lower, color_range_upper)], seed=seed or 0)
+
+""" The best quality level is the configured settings """
+if adaptive_quality is True:
+    quality_controller = QualityController(create_quality_levels(QualityLevel(
+        detection_scale, ball_detector.erode_iterations, ball_detector.dilate_iterations, detection_interval,
+        pts.maxlen)), frame_budget)
+
 
 # endregion
 
@@ -189,43 +517,116 @@ def get_cam_frame(is_color, video_camera):
     """
     Retrieves the camera. Will exit if no camera is found. Also will convert to black and white, depending on parameter.
 
+    The camera is read into the image from the previous frame, and converted into the buffer pool, so no new arrays are
+    created once the game is running.
+
     :param is_color:     Whether or not the image should be converted to black and white
                             - Supports either 'True' or 'False'
     :param video_camera: The camera (which should be opened already by OpenCV, from the global variables)
+                            - Can also be a 'CameraCapture', which reads the camera on its own thread
+                            - Can also be a 'ProcessPipeline', which reads the camera in its own process
+                            - Can also be a 'FrameRecorder' or 'ReplaySource', which record or replay the camera
+                            - Can also be a 'SyntheticScene', which draws a ball following a scripted path
     :return f:           A named tuple for Frame, which consists of:
                             - OpenCV frame
-                            - Pygame frame (it's the OpenCV converted to a Pygame surface)
+                            - Pygame frame (the OpenCV frame copied into a persistent, screen oriented Pygame surface)
+                            - The time the frame was captured (from the camera if it timestamps its frames, otherwise
+                              the time it was read)
+                            - The frame's ID (from the camera if it numbers its frames, otherwise counted here)
     """
-    return_value, camera_frame = video_camera.read()
+    global camera_surface, camera_image
+
+    return_value, camera_image = video_camera.read(camera_image)
+    timestamp = getattr(video_camera, 'last_timestamp', None)
+    if timestamp is None:
+        timestamp = time.time()
+
+    frame_id = getattr(video_camera, 'last_frame_id', None)
+    if frame_id is None:
+        frame_id = num_frames + 1
+
     if return_value is not True:
         print "NO CAMERA FOUND...EXITING"
         exit()
 
-    camera_frame = cv2.cvtColor(camera_frame, cv2.COLOR_BGR2RGB)
+    frame_height, frame_width = camera_image.shape[:2]
+    buffer_pool.set_resolution(frame_width, frame_height)
+
+    camera_frame = cv2.cvtColor(camera_image, cv2.COLOR_BGR2RGB, dst=buffer_pool.get('rgb', channels=3))
     if not is_color:
-        camera_frame = cv2.cvtColor(camera_frame, cv2.COLOR_BGR2GRAY)
-        camera_frame = cv2.cvtColor(camera_frame, cv2.COLOR_GRAY2RGB)
+        gray_frame = cv2.cvtColor(camera_frame, cv2.COLOR_BGR2GRAY, dst=buffer_pool.get('gray'))
+        camera_frame = cv2.cvtColor(gray_frame, cv2.COLOR_GRAY2RGB, dst=camera_frame)
+
+    """
+    The OpenCV frame is (height, width), while Pygame surfaces are (width, height).
+    Copying a swapped view of the frame puts it the right way around, without creating any new surfaces.
+    """
+    if camera_surface is None or camera_surface.get_size() != (frame_width, frame_height):
+        camera_surface = pygame.Surface((frame_width, frame_height)).convert()
 
-    f = Frame(camera_frame, pygame.surfarray.make_surface(camera_frame))
+    pygame.surfarray.blit_array(camera_surface, camera_frame.swapaxes(0, 1))
+
+    f = Frame(camera_frame, camera_surface, timestamp, frame_id)
 
     return f
 
 
 def blit_cam_frame(camera_frame, game_screen):
     """
-    Transform the frame by rotating and flipping it. After this, outputs the screen to the user
+    Outputs the frame to the user. The frame is already the right way around (see 'get_cam_frame').
 
     :param camera_frame: A frame that was captured by the video camera
     :param game_screen:  The Pygame screen
     :return:             The Pygame screen
     """
-    surf = pygame.transform.rotate(camera_frame, -90)
-    surf = pygame.transform.flip(surf, True, False)
-
-    game_screen.blit(surf, (0, 0))
+    game_screen.blit(camera_frame, (0, 0))
     return game_screen
 
 
+# endregion
+
+# region Metrics
+
+
+def save_stage_metrics():
+    """
+    Saves the stage metrics to 'metrics_csv_path' and 'metrics_json_path' (either can be None to skip it)
+
+    :return: None
+    """
+    if metrics_csv_path is not None:
+        stage_metrics.save_csv(metrics_csv_path)
+
+    if metrics_json_path is not None:
+        stage_metrics.save_json(metrics_json_path)
+
+
+# endregion
+
+# region Adaptive Quality
+
+
+def apply_quality_level(quality_level):
+    """
+    Changes the detection and trail settings to those of a quality level (from the 'quality_controller')
+
+    :param quality_level: A named tuple for QualityLevel
+    :return:              None
+    """
+    global detection_interval, pts
+
+    ball_detector.scale = quality_level.detection_scale
+
+    for detector in [ball_detector, multi_ball_detector]:
+        detector.erode_iterations = quality_level.erode_iterations
+        detector.dilate_iterations = quality_level.dilate_iterations
+
+    detection_interval = quality_level.detection_interval
+
+    """ The newest points of the trail are kept """
+    pts = deque(pts, maxlen=quality_level.trail_length)
+
+
 # endregion
 
 # region Resolution
@@ -236,21 +637,53 @@ def CalculateResolutionMultiplication():
     return multiply_width, multiply_height
 # endregion
 
+# region HUD
+hud = Hud(tnr_font)
+
+""" The two circles covering the base (for looks) are only drawn once for each resolution """
+hud.add_overlay('base rings', lambda resolution: create_base_rings(resolution, CalculateResolutionMultiplication()[1]))
+hud.add_text('lives', "Lives: {0}", (25, screen_height - 35))
+
+if show_score is True:
+    hud.add_text('score', "Score: {0}", (25, screen_height - 65))
+
+if show_fps is True:
+    hud.add_text('fps', "FPS: {0:.0f}", (screen_width - 120, 25))
+
+if show_tracking_status is True:
+    hud.add_text('tracking status', "{0}", (screen_width - 160, screen_height - 35))
+# endregion
+
 # region Main Game Loop
 start = time.time()
+last_frame_start_time = start
 
 while running:
-    """ Exit the game if the 'ESC' key is pressed """
+    stage_metrics.start_frame()
+
+    """ Exit the game if the 'ESC' key is pressed. 'M' shows the stage metrics, and 'S' saves them """
     for event in pygame.event.get():
         if event.type == QUIT:
             running = False
         elif event.type == KEYDOWN:
             if event.key == K_ESCAPE:
                 running = False
+            elif event.key == K_m:
+                show_metrics_overlay = not show_metrics_overlay
+            elif event.key == K_s:
+                save_stage_metrics()
+
+    if run_duration > 0 and time.time() - start >= run_duration:
+        running = False
 
     final_screen.fill(0)
     frame = get_cam_frame(screen_is_color, camera)
 
+    if latency_trace is not None:
+        latency_trace.begin_frame(frame.frame_id, frame.timestamp)
+
+    stage_metrics.finish_stage('capture')
+
     num_frames += 1
 
     ##############################
@@ -262,123 +695,166 @@ while running:
     Object tracking is done through tracking a specific range of colors
     """
     surface_array = frame.org
-    hsv = cv2.cvtColor(surface_array, cv2.COLOR_RGB2HSV)
-
-    color_mask = cv2.inRange(hsv, color_range_lower, color_range_upper)
-    color_mask = cv2.erode(color_mask, None, iterations=2)
-    color_mask = cv2.dilate(color_mask, None, iterations=2)
-
-    contours = cv2.findContours(color_mask.copy(),
-                                cv2.RETR_EXTERNAL,
-                                cv2.CHAIN_APPROX_SIMPLE)[-2]
     center = None
 
     """
-    Will only calculate and draw the ball object if it has found one
+    Detection only runs every 'detection_interval' frames. In between, the tracker(s) predict where the ball is.
 
     Also requires the radius to total 10 or more
     """
-    if len(contours) > 0:
-
-        c = max(contours, key=cv2.contourArea)
-        ((ball_x, ball_y), ball_radius) = cv2.minEnclosingCircle(c)
-        M = cv2.moments(c)
-        center = (int(M['m10'] / M['m00']), int(M['m01'] / M['m00']))
+    run_detection = num_frames % detection_interval == 0
 
-        if ball_radius > 10:
+    if multi_ball_tracking is True:
+        if run_detection:
+            detections = multi_ball_detector.detect(surface_array)
+            multi_ball_tracker.update(detections, frame.timestamp)
 
             if show_ball is True:
-                cv2.circle(surface_array, (int(ball_x), int(ball_y)),
-                           int(ball_radius), ball_color, 2)
-                cv2.circle(surface_array, center, 5, ball_color, -1)
+                for profile, detection in detections:
+                    cv2.circle(surface_array, (int(detection.x), int(detection.y)),
+                               int(detection.radius), ball_color, 2)
+                    cv2.circle(surface_array, detection.center, 5, ball_color, -1)
+        else:
+            multi_ball_tracker.predict(frame.timestamp)
 
-            """
-            Attempts to determine whether or not the ball traveling up or not. If it is, skip collision.
+        tracked_balls = multi_ball_tracker.trackers
+    else:
+        if run_detection:
+            if use_process_pipeline is True:
+                detection = camera.last_detection
+            else:
+                detection = ball_detector.detect(surface_array)
 
-            This is so that the ball doesn't remove any boxes in its' path as it travels up.
-                - This prevents people from through the ball straight up in front of the camera
-            """
-            if lastFall is None:
-                lastFall = ball_y
+            if detection is not None and detection.radius > 10:
+                center = detection.center
+                ball_tracker.update(detection, frame.timestamp)
+
+                if show_ball is True:
+                    cv2.circle(surface_array, (int(detection.x), int(detection.y)),
+                               int(detection.radius), ball_color, 2)
+                    cv2.circle(surface_array, center, 5, ball_color, -1)
             else:
-                if ball_y > lastFall:
-                    collision_check_skip = True
-                else:
-                    collision_check_skip = False
+                ball_tracker.predict(frame.timestamp)
+        else:
+            ball_tracker.predict(frame.timestamp)
+
+        tracked_balls = [ball_tracker] if ball_tracker.is_tracking() else []
+
+    stage_metrics.finish_stage('detection')
+
+    """
+    Uses the tracked ball(s) for collision, predicted to when this frame will actually be displayed.
+    Each ball is swept from where it was at the last collision test to where it is now.
 
-                lastFall = ball_y * 1.01
+    Collision is skipped for a ball while it is traveling up.
+    This is so that the ball doesn't remove any boxes in its' path as it travels up.
+        - This prevents people from through the ball straight up in front of the camera
+        - The ball's previous position is forgotten while it is skipped, so the sweep never covers the way up either
+    """
+    colliding_balls, previous_ball_positions = get_ball_paths(tracked_balls, previous_ball_positions,
+                                                              frame.timestamp + display_latency, ball_upward_speed)
+
+    if len(tracked_balls) > 0:
+        ball_x, ball_y = tracked_balls[0].position
+        ball_radius = tracked_balls[0].radius
+
+        if center is None:
+            center = (int(ball_x), int(ball_y))
 
     """ Handles the management of the boxes, such as creating and updating them """
     surface_array = frame.pg
     if initializedBoxes is False:
         box_class = Box(surface_array)
         box_class.resolution_multiply = CalculateResolutionMultiplication()
+        box_class.rotation_cache.max_bytes = rotation_cache_megabytes * 1024 * 1024
+
+        if box_color_levels is not None:
+            box_class.color_palette = Box.create_color_palette(box_color_levels)
         initializedBoxes = True
 
     box_class.screen = surface_array
 
-    box_class.box_manager()
-    surface_array = frame.org
+    """
+    The boxes and explosions move in fixed steps, for however much time has passed, so the game runs at the same speed
+    no matter the frame rate.
 
-    for index, box in enumerate(box_class.boxes):
-        box_size = box.img.get_size()
-        box_center = (
-            (box.location[0] + box_size[0] / 2),
-            (box.location[1] + box_size[1] / 2))
+    Headless runs aren't shown to anyone, so they run exactly one step per frame instead. The game logic then runs as
+    fast as the frames can be processed, rather than at 'simulation_rate' steps per second of wall-clock time.
+    """
+    frame_start_time = time.time()
+    if headless is True:
+        frame_elapsed_time = simulation_step
+    else:
+        frame_elapsed_time = frame_start_time - last_frame_start_time
+
+    simulation_time = min(simulation_time + frame_elapsed_time, max_simulation_steps * simulation_step)
+    last_frame_start_time = frame_start_time
+
+    while simulation_time >= simulation_step:
+        box_class.box_manager()
 
-        x1 = box_center[0]
-        y1 = box_center[1]
+        for exp in explosions:
+            if exp.finished is False:
+                exp.run()
 
-        box_radius = (box_size[0] - box.padding) / 2
+        simulation_time -= simulation_step
 
-        if collision_check_skip is not True:
-            x2 = ball_x
-            y2 = ball_y
+    simulation_alpha = simulation_time / simulation_step
+
+    surface_array = frame.org
+    stage_metrics.finish_stage('boxes')
 
-            dist = math.hypot(x1 - x2, y1 - y2)
+    """
+    Every box is tested against every colliding ball, and against the home base, in one pass.
+    The boxes that were hit (or reached the home base) are only removed once the pass is done.
+    """
+    box_slots, box_centers, box_radii = get_box_circles(box_class.store)
+    hit_boxes, home_boxes = find_collisions(box_centers, box_radii, colliding_balls,
+                                            (screen_width / 2, screen_height + 25), 100)
 
-            sum_radius = box_radius + ball_radius
+    for index in hit_boxes:
+        box_center_x, box_center_y = box_centers[index]
+        box_radius = box_radii[index]
 
-            if dist < sum_radius:
-                try:
-                    box_class.boxes.pop(index)
+        score += 1
 
-                    ne = explosion
-                    ne.location = (
-                        box_center[0] - box_radius,
-                        box_center[1] - box_radius)
-                    ne.strips[ne.n].iter()
-                    ne.finished = False
+        """ Each hit gets its own explosion, so several boxes hit in the same frame each explode where they were """
+        ne = explosion.spawn((
+            int(box_center_x - box_radius),
+            int(box_center_y - box_radius)))
 
-                    if enable_hue is True:
-                        hue.flash_hit(1)
+        if enable_hue is True:
+            hue.flash_hit(1)
 
-                    explosions.append(ne)
-                except ValueError:
-                    pass
+        if latency_trace is not None:
+            latency_trace.add_instant('box hit')
 
-        # HOME BASE #
-        x2 = screen_width / 2
-        y2 = screen_height + 25
+        explosions.append(ne)
 
-        dist = math.hypot(x1 - x2, y1 - y2)
+    for index in home_boxes:
+        if enable_hue is True:
+            hue.flash_error(1)
 
-        sum_radius = box_radius + 100
+        if latency_trace is not None:
+            latency_trace.add_instant('base hit')
 
-        if dist < sum_radius:
-            try:
-                box_class.boxes.pop(index)
+        lives -= 1
+        if lives <= 0:
+            """
+            Headless runs with a duration are soak tests, so they start again with full lives instead (and the resets
+            are counted, and printed on exit)
+            """
+            if headless is True and run_duration > 0:
+                lives = starting_lives
+                lives_resets += 1
+            elif running is True:
+                print "GAME OVER"
+                running = False
 
-                if enable_hue is True:
-                    hue.flash_error(1)
+    box_class.store.remove(box_slots[hit_boxes])
+    box_class.store.remove(box_slots[home_boxes])
 
-                lives -= 1
-                if lives <= 0:
-                    print "GAME OVER"
-                    running = False
-            except ValueError:
-                pass
-                # HOME BASE #
+    stage_metrics.finish_stage('collision')
 
     """ Update the ball trail, if it is currently being shown """
     pts.appendleft(center)
@@ -396,48 +872,84 @@ while running:
                      drag_trail_color,
                      drag_trail_final_thickness)
 
+    stage_metrics.finish_stage('trail')
+
     """ Creates a new Pygame surface in order create a new OpenCV frame (which will be used for animations """
     # final_surface_array = pygame.surfarray.make_surface(surface_array)
     final_surface_array = frame.pg
     final_screen = blit_cam_frame(final_surface_array, final_screen)
 
-    """ Creates a new explosion animation, if there are any to create """
-    for index, exp in enumerate(explosions):
-        if exp.finished is False:
-            final_screen.blit(exp.run(), exp.location)
-        else:
-            explosions.pop(index)
-
-    """ Loop through the boxes and display them on the screen. Also displays the UI text """
-    for index, boxData in enumerate(box_class.boxes):
-        final_screen.blit(boxData.img, boxData.location)
-
-        box_size = boxData.img.get_size()
+    """
+    The explosions, boxes and home image are added to the sprite batch (in the order they are drawn in), and drawn
+    with one call once they have all been added
+    """
+    explosions = [exp for exp in explosions if exp.finished is False]
 
-        box_center = (
-            (boxData.location[0] + box_size[0] / 2),
-            (boxData.location[1] + box_size[1] / 2))
-        box_center = (int(box_center[0]), int(box_center[1]))
+    for exp in explosions:
+        sprite_batch.add(exp.image, exp.location)
 
-        if draw_box_collision_circle is True:
-            pygame.draw.circle(final_screen, (0, 255, 0), box_center,
-                               (box_size[0] - boxData.padding) / 2, 3)
+    """ Loop through the boxes and display them on the screen. Also displays the UI text """
+    box_slots = box_class.store.get_alive()
+    box_locations = box_class.store.get_draw_locations(box_slots, simulation_alpha)
 
-        lives_label = tnr_font.render("Lives: " + str(lives), 1, (255, 255, 0))
-        final_screen.blit(lives_label, (25, screen_height - 35))
+    for slot, (box_x, box_y) in zip(box_slots, box_locations):
+        box_location = (int(box_x), int(box_y))
+        sprite_batch.add(box_class.get_box_image(slot), box_location)
 
     """ Displays the home image """
     for index, homeData in enumerate(box_class.home):
         home_size = homeData.img.get_size()
-        final_screen.blit(homeData.img, ((screen_width / 2) - (home_size[0] / 2), screen_height - (home_size[1] / 3)))
+        sprite_batch.add(homeData.img, ((screen_width / 2) - (home_size[0] / 2), screen_height - (home_size[1] / 3)))
+
+    sprite_batch.draw(final_screen)
+
+    """ The collision circles are drawn once the boxes have been, so they are shown over them """
+    if draw_box_collision_circle is True:
+        for slot, (box_x, box_y) in zip(box_slots, box_locations):
+            box_size = box_class.store.sizes[slot]
+
+            box_center = (
+                (int(box_x) + box_size[0] / 2),
+                (int(box_y) + box_size[1] / 2))
+            box_center = (int(box_center[0]), int(box_center[1]))
+            box_radius = int(box_size[0] - box_class.store.paddings[slot]) / 2
+
+            final_screen.blit(hud.get_circle_image(box_radius, (0, 255, 0), 3),
+                              (box_center[0] - box_radius, box_center[1] - box_radius))
+
+    """ Displays the two circles covering the base (for looks), and the UI text """
+    hud.set_value('lives', lives)
+    hud.set_value('score', score)
+    hud.set_value('fps', clock.get_fps())
+    hud.set_value('tracking status', "Tracking" if len(tracked_balls) > 0 else "Searching")
+    hud.draw(final_screen)
+
+    if show_metrics_overlay is True:
+        stage_metrics.draw_overlay(tnr_font, final_screen)
+
+    stage_metrics.finish_stage('render')
+
+    if headless is not True:
+        pygame.display.flip()
+
+    if frame_pacing == 'fixed':
+        clock.tick(max_frame_rate)
+    else:
+        clock.tick()
 
-    """ Displays the two circles covering the base (for looks) """
-    pygame.draw.circle(final_screen, (255, 255, 0), (screen_width / 2, screen_height + 25),
-                       int(160 * CalculateResolutionMultiplication()[1]), 5)
-    pygame.draw.circle(final_screen, (255, 0, 0), (screen_width / 2, screen_height + 25),
-                       int(150 * CalculateResolutionMultiplication()[1]), 5)
+    stage_metrics.finish_stage('flip')
+    frame_time = stage_metrics.finish_frame()
 
-    pygame.display.flip()
+    if quality_controller is not None:
+        quality_level = quality_controller.update(frame_time)
+        if quality_level is not None:
+            apply_quality_level(quality_level)
+
+    if latency_trace is not None:
+        latency_trace.finish_frame()
+
+    if predict_display_latency is True:
+        display_latency += ((time.time() - frame.timestamp) - display_latency) * 0.1
 # endregion
 
 # region Frame Rate
@@ -451,9 +963,36 @@ if debug_fps:
     # Calculate frames per second
     fps = num_frames / seconds
     print "Estimated frames per second : {0}".format(fps)
+
+    if isinstance(camera, (CameraCapture, ReplaySource)):
+        print "Camera frames dropped : {0}".format(camera.dropped_frames)
+
+""" Headless runs are usually soak tests, so the frame rate and memory use are always shown """
+if headless is True:
+    print "Frames : {0} in {1:.1f} seconds ({2:.1f} frames per second)".format(num_frames, end - start,
+                                                                             num_frames / (end - start))
+
+    if resource is not None:
+        print "Peak memory : {0} KB".format(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+    if run_duration > 0:
+        print "Lives reset : {0}".format(lives_resets)
 # endregion
 
 # region Exit
+if save_metrics_on_exit is True:
+    save_stage_metrics()
+
+if latency_trace is not None:
+    latency_trace.save(trace_path)
+
+camera.release()
+
+if parallel_mask is not None:
+    parallel_mask.close()
 pygame.quit()
-cv2.destroyAllWindows()
+
+""" Headless machines often have a build of OpenCV with no window support at all """
+if headless is not True:
+    cv2.destroyAllWindows()
 # endregion
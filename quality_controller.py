@@ -0,0 +1,132 @@
+"""
+Adaptive quality controller
+
+Watches how long each frame takes and, when frames keep going over the frame budget, steps down to a cheaper quality
+level (smaller ball trail, less noise removal, detection at a lower scale, detection on fewer frames). Once there is
+enough headroom again, it steps back up. Every change is printed, so a session can be looked back over.
+
+Quality levels only ever change one step at a time, and not again until 'cooldown_frames' have passed, so the
+controller doesn't flip back and forth between two levels.
+
+Xlantra1
+Copyright (c) 2017
+MIT License
+"""
+
+# region Imports
+from collections import namedtuple
+
+import numpy as np
+
+# endregion
+
+# region Named Tuples
+QualityLevel = namedtuple('QualityLevel', 'detection_scale erode_iterations dilate_iterations detection_interval '
+                                          'trail_length')
+# endregion
+
+# region Quality Levels
+
+
+def create_quality_levels(best_quality):
+    """
+    Creates the quality levels, from the best down to the cheapest. Each level lowers one more setting than the
+    level before it, starting with the ones that are least noticeable while playing.
+
+    :param best_quality: A named tuple for QualityLevel, with the settings the game was configured with
+    :return:             A list of named tuples for QualityLevel (the first is 'best_quality')
+    """
+    levels = [best_quality]
+
+    def add_level(**changes):
+        level = levels[-1]._replace(**changes)
+        if level != levels[-1]:
+            levels.append(level)
+
+    add_level(trail_length=max(8, best_quality.trail_length / 2))
+    add_level(erode_iterations=1, dilate_iterations=1)
+    add_level(detection_scale=min(best_quality.detection_scale, 0.5))
+    add_level(detection_interval=max(best_quality.detection_interval, 2))
+    add_level(detection_scale=min(best_quality.detection_scale, 0.25))
+    add_level(detection_interval=max(best_quality.detection_interval, 3))
+
+    return levels
+
+
+# endregion
+
+
+# region Quality Controller Class
+class QualityController(object):
+    # region Initialization
+    def __init__(self, levels, frame_budget=1000.0 / 30.0, window=30, headroom=0.7, cooldown_frames=60):
+        """
+        :param levels:          A list of named tuples for QualityLevel, from the best down to the cheapest
+        :param frame_budget:    How long a frame should take (in milliseconds)
+        :param window:          How many frames the frame time is averaged over
+        :param headroom:        Quality goes back up once frames take less than this much of the budget
+        :param cooldown_frames: How many frames to wait after a change, before changing again
+        """
+        self.levels = levels
+        self.frame_budget = frame_budget
+        self.headroom = headroom
+        self.cooldown_frames = cooldown_frames
+
+        self.level_index = 0
+
+        self.frame_times = np.zeros(window)
+        self.frame_count = 0
+        self.frames_since_change = 0
+
+    # endregion
+
+    # region Quality
+    @property
+    def level(self):
+        """ The current quality level """
+        return self.levels[self.level_index]
+
+    def change_level(self, level_index, frame_time, reason):
+        """
+        Changes to another quality level, and prints why
+
+        :param level_index: The index of the new level
+        :param frame_time:  The average frame time that caused the change (in milliseconds)
+        :param reason:      Why the level changed
+        :return:            The new quality level
+        """
+        self.level_index = level_index
+        self.frames_since_change = 0
+        self.frame_count = 0
+
+        print "Frame time {0:.1f} ms {1} the {2:.1f} ms budget, quality level {3} of {4}: {5}".format(
+            frame_time, reason, self.frame_budget, level_index, len(self.levels) - 1,
+            ", ".join("{0} {1}".format(name, value) for name, value in self.level._asdict().items()))
+
+        return self.level
+
+    def update(self, frame_time):
+        """
+        Adds a frame's time, and changes the quality level if the frames have been too slow (or fast enough)
+
+        :param frame_time: How long the frame took (in milliseconds)
+        :return:           The new quality level if it changed, otherwise None
+        """
+        self.frame_times[self.frame_count % len(self.frame_times)] = frame_time
+        self.frame_count += 1
+        self.frames_since_change += 1
+
+        if self.frame_count < len(self.frame_times) or self.frames_since_change < self.cooldown_frames:
+            return None
+
+        average_frame_time = self.frame_times.mean()
+
+        if average_frame_time > self.frame_budget and self.level_index < len(self.levels) - 1:
+            return self.change_level(self.level_index + 1, average_frame_time, "is over")
+
+        if average_frame_time < self.frame_budget * self.headroom and self.level_index > 0:
+            return self.change_level(self.level_index - 1, average_frame_time, "is well under")
+
+        return None
+    # endregion
+# endregion
@@ -0,0 +1,92 @@
+"""
+Rotation cache
+
+Boxes and the home base only ever turn a degree at a time, through the same 360 angles, so each rotated image is
+rendered the first time it is needed and looked up from then on. Each image is known by a key (e.g. its path, scale
+and color), and has up to 360 rotations cached.
+
+The cache is held under a memory budget. Once the rotated images take up more than 'max_bytes', the least recently
+used are dropped (and rendered again if they are needed later).
+
+Xlantra1
+Copyright (c) 2017
+MIT License
+"""
+
+# region Imports
+from collections import OrderedDict
+
+# endregion
+
+
+# region Rotation Cache Class
+class RotationCache(object):
+    # region Initialization
+    def __init__(self, rotate, max_bytes=64 * 1024 * 1024):
+        """
+        :param rotate:    The function that rotates an image, as rotate(image, angle)
+        :param max_bytes: How much memory the rotated images can take up, before the least recently used are dropped
+        """
+        self.rotate = rotate
+        self.max_bytes = max_bytes
+
+        # The rotated images by (key, angle), from the least to the most recently used
+        self.images = OrderedDict()
+        self.size_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    # endregion
+
+    # region Rotations
+    @staticmethod
+    def get_image_bytes(image):
+        """
+        How much memory an image takes up
+
+        :param image: The image (a Pygame surface)
+        :return:      The size of the image's pixels (in bytes)
+        """
+        width, height = image.get_size()
+        return width * height * image.get_bytesize()
+
+    def get(self, key, angle, create_image):
+        """
+        An image at a rotation, rendered the first time it is asked for
+
+        :param key:          What the image is known by (e.g. its path, scale and color)
+        :param angle:        The rotation (in degrees)
+        :param create_image: A function that returns the unrotated image. Only called if the rotation isn't cached.
+        :return:             The rotated image (shared, so don't draw on it)
+        """
+        image_key = (key, int(angle) % 360)
+
+        image = self.images.pop(image_key, None)
+        if image is None:
+            self.misses += 1
+
+            image = self.rotate(create_image(), image_key[1])
+            self.size_bytes += self.get_image_bytes(image)
+        else:
+            self.hits += 1
+
+        """ The image is (re-)added at the end, as the most recently used """
+        self.images[image_key] = image
+
+        while self.size_bytes > self.max_bytes and len(self.images) > 1:
+            _, dropped_image = self.images.popitem(last=False)
+            self.size_bytes -= self.get_image_bytes(dropped_image)
+
+        return image
+
+    def clear(self):
+        """
+        Drops every rotated image (e.g. when the images they were made from change)
+
+        :return: None
+        """
+        self.images.clear()
+        self.size_bytes = 0
+    # endregion
+# endregion
@@ -37,6 +37,11 @@ class Explosion(object):
         self.location = (0, 0)
         self.finished = False
 
+        # Set for explosions started with 'spawn', which step through images shared with the explosion they came from
+        self.images = None
+        self.frames = 1
+        self.ticks = 0
+
     def initialize(self):
         fps = 12
         frames = fps / 12
@@ -57,8 +62,32 @@ class Explosion(object):
         self.image = self.strips[self.n].next()
         clock.tick(fps)
 
+    def spawn(self, location):
+        """
+        Starts a new explosion, with its own place in the animation, that shares this explosion's loaded images.
+        Several explosions can then play at once (e.g. when more than one box is hit in a frame).
+
+        :param location: Where the top left of the explosion is drawn
+        :return:         The new explosion
+        """
+        explosion = Explosion()
+        explosion.images = self.strips[self.n].images
+        explosion.frames = self.strips[self.n].frames
+        explosion.image = explosion.images[0]
+        explosion.location = location
+
+        return explosion
+
     def run(self):
-        if len(self.strips) > 0:
+        if self.images is not None:
+            self.ticks += 1
+
+            image_index = int(self.ticks // self.frames)
+            if image_index < len(self.images):
+                self.image = self.images[image_index]
+            else:
+                self.finished = True
+        elif len(self.strips) > 0:
             try:
                 self.image = self.strips[self.n].next()
             except StopIteration:
@@ -0,0 +1,54 @@
+"""
+Sprite batch
+
+Collects every sprite drawn in a frame (boxes, the home base, explosions), and draws them all with one
+'Surface.blits' call instead of one 'blit' call each.
+
+Each sprite is drawn from its own image. The box images change every simulation step (each box turns by a degree, and
+has its own color), so packing them into a texture atlas only filled the atlas with images that were used once.
+
+Older versions of Pygame (before 1.9.4) don't have 'Surface.blits', so each sprite is drawn with 'blit' instead.
+
+Xlantra1
+Copyright (c) 2017
+MIT License
+"""
+
+
+# region Sprite Batch Class
+class SpriteBatch(object):
+    # region Initialization
+    def __init__(self):
+        # The sprites to draw this frame, as (image, location)
+        self.sprites = []
+
+    # endregion
+
+    # region Drawing
+    def add(self, image, location):
+        """
+        Adds a sprite to be drawn (sprites are drawn in the order they are added)
+
+        :param image:    The sprite's image
+        :param location: Where to draw the top left of the sprite
+        :return:         None
+        """
+        self.sprites.append((image, location))
+
+    def draw(self, screen):
+        """
+        Draws every sprite that was added, and empties the batch for the next frame
+
+        :param screen: The surface to draw on
+        :return:       None
+        """
+        if len(self.sprites) > 0:
+            if hasattr(screen, 'blits'):
+                screen.blits(self.sprites, False)
+            else:
+                for image, location in self.sprites:
+                    screen.blit(image, location)
+
+        self.sprites = []
+    # endregion
+# endregion
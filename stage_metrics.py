@@ -0,0 +1,193 @@
+"""
+Stage metrics
+
+Records how long each stage of the game loop (capture, detection, rendering, etc.) takes, every frame, over a rolling
+window of the most recent frames. The 50th/95th/99th percentiles and max of each stage can be shown on screen, or
+saved to CSV/JSON, so a slow frame can be traced back to the stage that caused it without attaching a profiler.
+
+Xlantra1
+Copyright (c) 2017
+MIT License
+"""
+
+# region Imports
+import csv
+import json
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# endregion
+
+
+# region Rolling Histogram Class
+class RollingHistogram(object):
+    # region Initialization
+    def __init__(self, window=300):
+        """
+        :param window: How many of the most recent durations are kept
+        """
+        self.durations = np.zeros(window)
+        self.count = 0
+
+    # endregion
+
+    # region Durations
+    def add(self, duration):
+        """
+        Adds a duration, replacing the oldest one once the window is full
+
+        :param duration: The duration (in milliseconds)
+        :return:         None
+        """
+        self.durations[self.count % len(self.durations)] = duration
+        self.count += 1
+
+    def get_summary(self):
+        """
+        Summarizes the durations in the window
+
+        :return: A dictionary of the 50th, 95th and 99th percentiles, and max (in milliseconds)
+        """
+        durations = self.durations[:min(self.count, len(self.durations))]
+        if len(durations) == 0:
+            return OrderedDict([('p50', 0.0), ('p95', 0.0), ('p99', 0.0), ('max', 0.0)])
+
+        p50, p95, p99 = np.percentile(durations, [50, 95, 99])
+
+        return OrderedDict([('p50', float(p50)), ('p95', float(p95)), ('p99', float(p99)),
+                            ('max', float(durations.max()))])
+    # endregion
+# endregion
+
+
+# region Stage Metrics Class
+class StageMetrics(object):
+    # region Initialization
+    def __init__(self, window=300):
+        """
+        :param window: How many of the most recent frames each stage's percentiles are over
+        """
+        self.window = window
+
+        # A histogram for every stage, in the order the stages were first seen, with the whole frame last
+        self.stages = OrderedDict()
+        self.frame = RollingHistogram(window)
+
+        self.frame_start = None
+        self.stage_start = None
+
+        # A 'LatencyTrace' that every stage is also added to (None to not trace)
+        self.trace = None
+
+        # The overlay's text is only rendered again every 'overlay_interval' frames
+        self.overlay_interval = 15
+        self.overlay_lines = []
+
+    # endregion
+
+    # region Timing
+    def start_frame(self):
+        """ Starts timing a new frame (and its first stage) """
+        self.frame_start = time.time()
+        self.stage_start = self.frame_start
+
+    def finish_stage(self, name):
+        """
+        Records how long a stage took, since the last stage finished (or the frame started)
+
+        :param name: The name of the stage that just finished
+        :return:     None
+        """
+        stage_end = time.time()
+
+        histogram = self.stages.get(name)
+        if histogram is None:
+            histogram = RollingHistogram(self.window)
+            self.stages[name] = histogram
+
+        histogram.add((stage_end - self.stage_start) * 1000.0)
+
+        if self.trace is not None:
+            self.trace.add_span(name, self.stage_start, stage_end)
+
+        self.stage_start = stage_end
+
+    def finish_frame(self):
+        """
+        Records how long the whole frame took
+
+        :return: How long the frame took (in milliseconds)
+        """
+        frame_time = (time.time() - self.frame_start) * 1000.0
+        self.frame.add(frame_time)
+
+        return frame_time
+
+    # endregion
+
+    # region Summary
+    def get_summary(self):
+        """
+        Summarizes every stage, and the whole frame
+
+        :return: The summary of every stage, keyed by stage name (the whole frame is 'frame')
+        """
+        summary = OrderedDict((name, histogram.get_summary()) for name, histogram in self.stages.items())
+        summary['frame'] = self.frame.get_summary()
+
+        return summary
+
+    def draw_overlay(self, font, screen, location=(25, 25), color=(255, 255, 0)):
+        """
+        Draws each stage's percentiles in the corner of the screen
+
+        :param font:     The Pygame font to render the text with
+        :param screen:   The surface to draw on
+        :param location: Where the top left of the text is drawn
+        :param color:    The color of the text
+        :return:         None
+        """
+        if self.frame.count % self.overlay_interval == 0 or len(self.overlay_lines) == 0:
+            self.overlay_lines = []
+            for name, summary in self.get_summary().items():
+                text = "{0}: p50 {1:.1f}  p95 {2:.1f}  p99 {3:.1f}  max {4:.1f} ms".format(name, *summary.values())
+                self.overlay_lines.append(font.render(text, 1, color))
+
+        x, y = location
+        for line in self.overlay_lines:
+            screen.blit(line, (x, y))
+            y += line.get_height()
+
+    # endregion
+
+    # region Saving
+    def save_csv(self, path):
+        """
+        Saves every stage's percentiles to a CSV file (one row per stage)
+
+        :param path: The path of the file
+        :return:     None
+        """
+        metrics_file = open(path, "wb")
+        writer = csv.writer(metrics_file)
+
+        writer.writerow(['stage', 'p50', 'p95', 'p99', 'max'])
+        for name, summary in self.get_summary().items():
+            writer.writerow([name] + ["{0:.3f}".format(value) for value in summary.values()])
+
+        metrics_file.close()
+
+    def save_json(self, path):
+        """
+        Saves every stage's percentiles to a JSON file
+
+        :param path: The path of the file
+        :return:     None
+        """
+        metrics_file = open(path, "w")
+        json.dump(self.get_summary(), metrics_file, indent=2)
+        metrics_file.close()
+    # endregion
+# endregion
@@ -0,0 +1,185 @@
+"""
+Synthetic scene
+
+Generates camera frames of a colored ball moving over a textured, noisy background along a scripted path. The same
+seed always gives exactly the same frames, so detection and the rest of the game can be timed (or checked) without a
+camera or anyone throwing a ball.
+
+The scene can be used in place of OpenCV's 'VideoCapture' (it has the same 'read', 'set' and 'release').
+
+Xlantra1
+Copyright (c) 2017
+MIT License
+"""
+
+# region Imports
+import math
+import time
+
+import cv2
+import numpy as np
+
+# endregion
+
+# region Global Variables
+# How many different noise patterns are cycled through (so every frame isn't identical)
+noise_frames = 4
+# endregion
+
+# region Trajectories
+
+
+def line_trajectory(t):
+    """
+    Straight across the frame, from the left to the right
+
+    :param t: How far along the path the ball is (0.0 to 1.0)
+    :return:  The position of the ball, as fractions of the frame's width and height
+    """
+    return 0.1 + 0.8 * t, 0.5
+
+
+def throw_trajectory(t):
+    """
+    Thrown up from the bottom left, falling back down on the right (a parabola)
+
+    :param t: How far along the path the ball is (0.0 to 1.0)
+    :return:  The position of the ball, as fractions of the frame's width and height
+    """
+    return 0.1 + 0.8 * t, 0.9 - 3.2 * t * (1.0 - t)
+
+
+def circle_trajectory(t):
+    """
+    Around a circle in the middle of the frame
+
+    :param t: How far along the path the ball is (0.0 to 1.0)
+    :return:  The position of the ball, as fractions of the frame's width and height
+    """
+    angle = 2.0 * math.pi * t
+    return 0.5 + 0.3 * math.cos(angle), 0.5 + 0.3 * math.sin(angle)
+
+
+trajectories = {
+    'line': line_trajectory,
+    'throw': throw_trajectory,
+    'circle': circle_trajectory
+}
+# endregion
+
+# region Drawing
+
+
+def create_background(width, height, random_state):
+    """
+    Creates a textured background (large, smooth patches of random color)
+
+    :param width:        The width of the frame
+    :param height:       The height of the frame
+    :param random_state: The NumPy 'RandomState' to draw the colors from
+    :return:             The background (3 channels)
+    """
+    background = random_state.randint(0, 256, (height / 16 + 1, width / 16 + 1, 3)).astype(np.uint8)
+    return cv2.resize(background, (width, height), interpolation=cv2.INTER_LINEAR)
+
+
+def hsv_to_color(color_hsv, color_conversion=cv2.COLOR_HSV2RGB):
+    """
+    Converts a single OpenCV HSV color
+
+    :param color_hsv:        The color (in OpenCV's HSV)
+    :param color_conversion: The OpenCV conversion to use (RGB by default)
+    :return:                 The color, as a tuple of integers
+    """
+    color = cv2.cvtColor(np.uint8([[color_hsv]]), color_conversion)[0][0]
+    return tuple(int(c) for c in color)
+
+
+# endregion
+
+
+# region Synthetic Scene Class
+class SyntheticScene(object):
+    # region Initialization
+    def __init__(self, width, height, ball_color_hsv, trajectory='throw', frame_count=90, seed=0, fps=30.0):
+        """
+        :param width:          The width of the frames
+        :param height:         The height of the frames
+        :param ball_color_hsv: The color of the ball (in OpenCV's HSV)
+        :param trajectory:     The name of the path the ball follows (see 'trajectories')
+        :param frame_count:    How many frames it takes the ball to follow the path once
+        :param seed:           The seed for the background and noise
+        :param fps:            The frame rate the frames are timestamped at
+        """
+        self.width = width
+        self.height = height
+        self.trajectory = trajectories[trajectory]
+        self.frame_count = frame_count
+        self.fps = fps
+
+        self.ball_radius = height / 20
+        self.ball_color = hsv_to_color(ball_color_hsv, cv2.COLOR_HSV2BGR)
+
+        random_state = np.random.RandomState(seed)
+        self.background = create_background(width, height, random_state)
+        self.noise = [random_state.randint(0, 16, self.background.shape).astype(np.uint8)
+                      for _ in xrange(noise_frames)]
+
+        self.frame_index = -1
+        self.start_time = None
+        self.last_timestamp = None
+
+    # endregion
+
+    # region Frames
+    def get_ball_position(self, frame_index):
+        """
+        Where the ball is in a frame (the path starts again every 'frame_count' frames)
+
+        :param frame_index: The index of the frame
+        :return:            The center of the ball, in pixels
+        """
+        x, y = self.trajectory(float(frame_index % self.frame_count) / self.frame_count)
+        return int(x * self.width), int(y * self.height)
+
+    def draw_frame(self, frame_index, image=None):
+        """
+        Draws a frame (BGR, like a camera frame)
+
+        :param frame_index: The index of the frame
+        :param image:       An image to draw into (it is created if None, or the wrong size)
+        :return:            The frame
+        """
+        if image is None or image.shape != self.background.shape:
+            image = np.empty_like(self.background)
+
+        cv2.add(self.background, self.noise[frame_index % noise_frames], dst=image)
+        cv2.circle(image, self.get_ball_position(frame_index), self.ball_radius, self.ball_color, -1)
+
+        return image
+
+    def read(self, image=None):
+        """
+        Draws the next frame. Returns the same values as OpenCV's 'VideoCapture.read', so it can be used in its place.
+        The frames are timestamped at 'fps', from the time of the first read.
+
+        :param image: The image from the previous read, which is drawn into again
+        :return:      Whether or not a frame was read (always True), and the frame itself
+        """
+        if self.start_time is None:
+            self.start_time = time.time()
+
+        self.frame_index += 1
+        self.last_timestamp = self.start_time + self.frame_index / self.fps
+
+        return True, self.draw_frame(self.frame_index, image)
+
+    def set(self, prop_id, value):
+        """ The scene's frames are always the same size, so this does nothing """
+        return False
+
+    def release(self):
+        """ Nothing to release """
+        pass
+    # endregion
+# endregion
@@ -0,0 +1,75 @@
+"""
+Tint cache
+
+Keeps the colored (tinted) copies of an image, so each color is only applied once instead of on every frame. Each
+tinted image is known by the image's key (e.g. its path and scale) and the color.
+
+Only the most recently used 'max_images' are kept. Box colors can be drawn from a small palette (see
+'Box.create_color_palette'), so boxes of the same color share one tinted image (and one set of rotations).
+
+Xlantra1
+Copyright (c) 2017
+MIT License
+"""
+
+# region Imports
+from collections import OrderedDict
+
+# endregion
+
+
+# region Tint Cache Class
+class TintCache(object):
+    # region Initialization
+    def __init__(self, tint, max_images=256):
+        """
+        :param tint:       The function that applies a color to an image, as tint(image, color)
+        :param max_images: How many tinted images are kept, before the least recently used are dropped
+        """
+        self.tint = tint
+        self.max_images = max_images
+
+        # The tinted images by (key, color), from the least to the most recently used
+        self.images = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    # endregion
+
+    # region Tints
+    def get(self, key, color, create_image):
+        """
+        An image in a color, tinted the first time it is asked for
+
+        :param key:          What the image is known by (e.g. its path and scale)
+        :param color:        The color (RGB)
+        :param create_image: A function that returns the untinted image. Only called if the tint isn't cached.
+        :return:             The tinted image (shared, so don't draw on it)
+        """
+        image_key = (key, tuple(color))
+
+        image = self.images.pop(image_key, None)
+        if image is None:
+            self.misses += 1
+            image = self.tint(create_image(), image_key[1])
+        else:
+            self.hits += 1
+
+        """ The image is (re-)added at the end, as the most recently used """
+        self.images[image_key] = image
+
+        while len(self.images) > self.max_images:
+            self.images.popitem(last=False)
+
+        return image
+
+    def clear(self):
+        """
+        Drops every tinted image (e.g. when the images they were made from change)
+
+        :return: None
+        """
+        self.images.clear()
+    # endregion
+# endregion